@@ -0,0 +1,122 @@
+"""
+Tests for change deduplication and the context buffer
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'watchdog'))
+
+from watchdog_monitor import ChangeDeduper, StateBuffer, WatchdogMonitor
+
+
+class FakeAnalyzer:
+    def __init__(self):
+        self.calls = []
+
+    async def analyze_changes(self, changes, context, monitoring_scope):
+        self.calls.append(changes)
+        return {'requires_attention': False, 'cost_info': {}}
+
+
+class FakeCostTracker:
+    def can_make_request(self):
+        return True
+
+    def record_request(self, cost_info):
+        pass
+
+
+def _change(entity_id, old_state, new_state, age_minutes=0):
+    return {
+        'entity_id': entity_id,
+        'old_state': old_state,
+        'new_state': new_state,
+        'last_changed': (datetime.now(timezone.utc) - timedelta(minutes=age_minutes)).isoformat(),
+        'domain': entity_id.partition('.')[0]
+    }
+
+
+class ChangeDeduperTest(unittest.TestCase):
+
+    def test_drops_repeated_transition(self):
+        deduper = ChangeDeduper(window=600)
+        change = _change('sensor.mode', 'eco', 'boost')
+        self.assertEqual(deduper.filter([change]), [change])
+        self.assertEqual(deduper.filter([dict(change)]), [])
+
+    def test_same_new_state_from_other_old_state_passes(self):
+        deduper = ChangeDeduper(window=600)
+        deduper.filter([_change('sensor.mode', 'eco', 'boost')])
+        change = _change('sensor.mode', 'off', 'boost')
+        self.assertEqual(deduper.filter([change]), [change])
+
+    def test_security_domains_always_pass(self):
+        deduper = ChangeDeduper(window=600)
+        for entity_id in ('lock.front_door', 'binary_sensor.back_door', 'alarm_control_panel.home'):
+            change = _change(entity_id, 'a', 'b')
+            self.assertEqual(deduper.filter([change]), [change])
+            self.assertEqual(deduper.filter([dict(change)]), [change])
+
+
+class StateBufferTest(unittest.TestCase):
+
+    def test_stale_backfill_stays_out_of_context(self):
+        buffer = StateBuffer()
+        fresh = _change('sensor.a', '1', '2', age_minutes=5)
+        stale = _change('sensor.b', '1', '2', age_minutes=120)
+        buffer.add_changes([fresh])
+        buffer.add_changes([stale])
+        self.assertEqual(buffer.get_context()['recent_changes'], [fresh])
+
+    def test_late_change_is_ordered_by_its_own_time(self):
+        buffer = StateBuffer()
+        newer = _change('sensor.a', '1', '2', age_minutes=1)
+        older = _change('sensor.b', '1', '2', age_minutes=10)
+        buffer.add_changes([newer, older])
+        self.assertEqual(buffer.get_context()['recent_changes'], [older, newer])
+
+    def test_unparseable_timestamp_is_skipped(self):
+        buffer = StateBuffer()
+        change = _change('sensor.a', '1', '2')
+        change['last_changed'] = 'not a time'
+        buffer.add_changes([change])
+        self.assertEqual(buffer.get_context()['buffer_size'], 0)
+
+    def test_oldest_changes_are_evicted(self):
+        buffer = StateBuffer(max_size=2)
+        changes = [_change('sensor.a', '1', '2', age_minutes=m) for m in (3, 1, 2)]
+        buffer.add_changes(changes)
+        self.assertEqual(buffer.changes, [changes[2], changes[1]])
+
+
+class ProcessChangesTest(unittest.TestCase):
+
+    def test_lock_unlock_sequence_is_analyzed_each_time(self):
+        analyzer = FakeAnalyzer()
+        monitor = WatchdogMonitor(
+            ha_client=None,
+            claude_analyzer=analyzer,
+            cost_tracker=FakeCostTracker(),
+            insight_manager=None,
+            config={'monitoring_scope': ['lock'], 'enable_learning': False}
+        )
+        sequence = [
+            _change('lock.front_door', 'locked', 'unlocked'),
+            _change('lock.front_door', 'unlocked', 'locked'),
+            _change('lock.front_door', 'locked', 'unlocked'),
+        ]
+
+        async def run():
+            for change in sequence:
+                await monitor._process_changes([change], datetime.now(timezone.utc))
+
+        asyncio.run(run())
+        self.assertEqual([calls[0]['new_state'] for calls in analyzer.calls], ['unlocked', 'locked', 'unlocked'])
+
+
+if __name__ == '__main__':
+    unittest.main()
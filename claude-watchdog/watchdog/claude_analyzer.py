@@ -2,29 +2,138 @@
 Claude analysis engine for interpreting Home Assistant state changes
 """
 
+import json
 import logging
+import re
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Response cache: identical monitoring windows reuse the previous analysis
+RESPONSE_CACHE_TTL = 300  # seconds
+RESPONSE_CACHE_SIZE = 256
+
+# Lexical prompt compression rules, applied once to static prompt text.
+# Placeholders like {threshold} are shielded so str.format still works.
+_PLACEHOLDER_RE = re.compile(r'\{[^{}]*\}')
+_HEDGE_RE = re.compile(r'\b(?:please|be concise but thorough\.?|in your analysis)\s*', re.IGNORECASE)
+_SCOPE_HEADER_RE = re.compile(r'^for (.+?)(?: monitoring| analysis)?, focus on:$', re.IGNORECASE)
+_STOPWORD_RE = re.compile(r'\b(?:a|an|the)\s+', re.IGNORECASE)
+_SUBSTITUTIONS = (
+    (re.compile(r'\bfor example\b', re.IGNORECASE), 'e.g.'),
+    (re.compile(r'\bthat is\b', re.IGNORECASE), 'i.e.'),
+    (re.compile(r'\bdo not\b', re.IGNORECASE), "don't"),
+    (re.compile(r'\bis not\b', re.IGNORECASE), "isn't"),
+)
+
+
+def _compress(text: str) -> str:
+    """Strip filler from prompt text and fold bullet lists into one line each"""
+    protected = []
+    
+    def _protect(match):
+        protected.append(match.group(0))
+        return f"\x00{len(protected) - 1}\x00"
+    
+    text = _PLACEHOLDER_RE.sub(_protect, text)
+    text = _HEDGE_RE.sub('', text)
+    for pattern, replacement in _SUBSTITUTIONS:
+        text = pattern.sub(replacement, text)
+    
+    lines: List[str] = []
+    for raw in text.splitlines():
+        line = ' '.join(raw.split())
+        if not line:
+            continue
+        header = _SCOPE_HEADER_RE.match(line)
+        if header:
+            line = header.group(1).capitalize() + ':'
+        elif line[0].islower():
+            line = line[0].upper() + line[1:]
+        if line.startswith('- '):
+            item = _STOPWORD_RE.sub('', line[2:])
+            # Append bullets to the preceding header as a ';'-separated list
+            if lines and (lines[-1].endswith(':') or lines[-1].endswith(';')):
+                lines[-1] = f"{lines[-1]} {item};"
+            else:
+                lines.append(f"{item};")
+        else:
+            lines.append(line)
+    
+    text = '\n'.join(line.rstrip(';') for line in lines) + '\n'
+    return re.sub(r'\x00(\d+)\x00', lambda m: protected[int(m.group(1))], text)
+
+# Fixed prompt sections. Kept byte-identical across calls so the Anthropic
+# prompt cache can match the whole instruction prefix.
+STATIC_PREAMBLE = _compress("""You are Claude Watchdog, an intelligent Home Assistant monitoring system.
+Analyze the following state changes and provide insights.
+""")
+
+STATIC_CLOSING = _compress("""
+Please analyze these changes and respond with:
+1. Overall assessment (normal/concerning/urgent)
+2. Specific insights or patterns detected
+3. Confidence level (0.0-1.0)
+4. Recommended actions (if any)
+5. Whether this requires immediate attention
+
+Focus on:
+- Unusual patterns or anomalies
+- Energy optimization opportunities
+- Security concerns
+- Device health issues
+- Performance problems
+
+Be concise but thorough. Only flag for attention if confidence > {threshold}.
+""")
+
+
+@lru_cache(maxsize=32)
+def _static_prefix(scope_key: tuple, templates: tuple, threshold: float) -> str:
+    """Build the static instruction prefix once per scope combination"""
+    template_map = dict(templates)
+    scope_templates = ''.join(template_map[s] for s in scope_key if s in template_map)
+    return (
+        STATIC_PREAMBLE
+        + f"Current scope: {', '.join(scope_key)}\n"
+        + scope_templates
+        + STATIC_CLOSING.format(threshold=threshold)
+    )
+
 class ClaudeAnalyzer:
     """Claude-powered analysis engine for Home Assistant monitoring"""
     
+    # Field extraction for text analysis results
+    _ATTENTION_RE = re.compile(r'Attention Required:\s*(True|False)', re.IGNORECASE)
+    _CONFIDENCE_RE = re.compile(r'Confidence:\s*([0-9.]+)')
+    _NON_INSIGHT_PREFIXES = ('Analysis Status:', 'Confidence:', 'Attention Required:')
+    
     def __init__(self, model: str = "claude-3-5-haiku-20241022", insight_threshold: float = 0.8):
         self.model = model
         self.insight_threshold = insight_threshold
         self.client = None  # Will be initialized with actual Anthropic client
+        self.full_detail = False  # Debug: dump the last 10 raw changes instead of a summary
         
-        # Analysis templates for different monitoring types
+        # Analysis templates for different monitoring types (compressed once)
         self.analysis_templates = {
-            'climate': self._get_climate_template(),
-            'security': self._get_security_template(),
-            'energy': self._get_energy_template(),
-            'automation_performance': self._get_automation_template(),
-            'device_health': self._get_device_health_template(),
-            'patterns': self._get_pattern_template()
+            'climate': _compress(self._get_climate_template()),
+            'security': _compress(self._get_security_template()),
+            'energy': _compress(self._get_energy_template()),
+            'automation_performance': _compress(self._get_automation_template()),
+            'device_health': _compress(self._get_device_health_template()),
+            'patterns': _compress(self._get_pattern_template())
         }
+        
+        # Hashable view of the templates for the static prefix cache
+        self._templates_key = tuple(sorted(self.analysis_templates.items()))
+        
+        # Fingerprint -> (monotonic timestamp, structured result)
+        self._response_cache: OrderedDict = OrderedDict()
     
     async def analyze_changes(self, changes: List[Dict], context: Dict, monitoring_scope: List[str]) -> Dict[str, Any]:
         """Analyze state changes and return insights"""
@@ -32,114 +141,179 @@ class ClaudeAnalyzer:
             return {'requires_attention': False, 'insights': []}
         
         try:
+            # Skip the API call entirely if this change set was just analyzed
+            cache_key = self._fingerprint(changes, monitoring_scope)
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                return cached
+            
             # Build analysis prompt based on scope and changes
             prompt = self._build_analysis_prompt(changes, context, monitoring_scope)
             
-            # TODO: Replace with actual Anthropic client call
+            # TODO: Replace with actual Anthropic client call, passing the
+            # content blocks through unchanged so the cached prefix is reused:
+            #   await anthropic.AsyncAnthropic().messages.create(
+            #       model=self.model, max_tokens=1000,
+            #       messages=[{'role': 'user', 'content': prompt}],
+            #       extra_headers={'anthropic-beta': 'prompt-caching-2024-07-31'})
             # For now, return mock analysis
             analysis_result = await self._mock_claude_analysis(prompt, changes)
             
             # Process and structure the response
             structured_result = self._structure_analysis(analysis_result, changes)
             
+            self._store_cached_response(cache_key, structured_result)
             return structured_result
             
         except Exception as e:
             logger.error(f"Analysis error: {e}")
             return {'requires_attention': False, 'error': str(e)}
     
-    def _build_analysis_prompt(self, changes: List[Dict], context: Dict, scope: List[str]) -> str:
-        """Build analysis prompt for Claude"""
+    def _fingerprint(self, changes: List[Dict], scope: List[str]) -> str:
+        """Canonical key for a change set: scope, per-domain counts and each entity's new state"""
+        canonical = json.dumps({
+            'scope': sorted(scope),
+            'by_domain': sorted(Counter(c.get('domain') or '' for c in changes).items()),
+            # 'unlocked' then 'locked' on the same door must not share an analysis
+            'states': sorted({(c.get('entity_id') or '', str(c.get('new_state'))) for c in changes})
+        }, sort_keys=True)
+        return blake2b(canonical.encode(), digest_size=16).hexdigest()
+    
+    def _get_cached_response(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of a cached analysis, or None if missing/expired"""
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
         
-        # Base prompt
-        prompt = f"""You are Claude Watchdog, an intelligent Home Assistant monitoring system. 
-Analyze the following state changes and provide insights.
+        stored_at, result = entry
+        if time.monotonic() - stored_at > RESPONSE_CACHE_TTL:
+            del self._response_cache[key]
+            return None
+        
+        self._response_cache.move_to_end(key)
+        logger.debug(f"Analysis cache hit for {key}")
+        return {
+            **result,
+            'analysis_timestamp': datetime.now().isoformat(),
+            'cached': True,
+            'cost_info': {**result['cost_info'], 'estimated_tokens': 0, 'estimated_cost': 0.0}
+        }
+    
+    def _store_cached_response(self, key: str, result: Dict[str, Any]):
+        """Store an analysis result, evicting the least recently used entry"""
+        self._response_cache[key] = (time.monotonic(), result)
+        self._response_cache.move_to_end(key)
+        if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+    
+    def _build_analysis_prompt(self, changes: List[Dict], context: Dict, scope: List[str]) -> List[Dict[str, Any]]:
+        """Build analysis prompt for Claude as Anthropic content blocks.
 
-Current scope: {', '.join(scope)}
-Time: {datetime.now().isoformat()}
+        Static instructions come first and are marked for prompt caching so
+        repeated calls with the same scope reuse the cached prefix; only the
+        trailing block (time + changes) varies per request.
+        """
+        
+        # Dynamic block: everything that changes between calls goes last
+        dynamic = f"""Time: {datetime.now().isoformat()}
 Recent changes: {len(changes)}
 Context buffer: {context.get('change_count', 0)} recent changes
 
 State Changes:
 """
         
-        # Add change details
-        for change in changes[-10:]:  # Last 10 changes
-            prompt += f"""
-Entity: {change.get('entity_id')}
-Domain: {change.get('domain')}
-Change: {change.get('old_state')} → {change.get('new_state')}
-Time: {change.get('last_changed')}
-"""
-        
-        # Add scope-specific analysis instructions
-        for scope_item in scope:
-            if scope_item in self.analysis_templates:
-                prompt += f"\n{self.analysis_templates[scope_item]}"
+        if self.full_detail:
+            # Add change details
+            for change in changes[-10:]:  # Last 10 changes
+                dynamic += self._format_change(change)
+        else:
+            summary = self._summarize_changes(changes)
+            by_domain = ', '.join(f"{domain}={count}" for domain, count in summary['by_domain'].most_common())
+            top_entities = ', '.join(f"{entity_id}={count}" for entity_id, count in summary['top_entities'])
+            exemplars = ''.join(self._format_change(change) for change in summary['exemplars'])
+            dynamic += f"""By domain: {by_domain}
+Most active: {top_entities}
+Examples:{exemplars}"""
         
-        prompt += f"""
-
-Please analyze these changes and respond with:
-1. Overall assessment (normal/concerning/urgent)
-2. Specific insights or patterns detected
-3. Confidence level (0.0-1.0)
-4. Recommended actions (if any)
-5. Whether this requires immediate attention
-
-Focus on:
-- Unusual patterns or anomalies
-- Energy optimization opportunities  
-- Security concerns
-- Device health issues
-- Performance problems
-
-Be concise but thorough. Only flag for attention if confidence > {self.insight_threshold}.
-"""
-        
-        return prompt
+        return [
+            {'type': 'text', 'text': self._get_static_prefix(scope), 'cache_control': {'type': 'ephemeral'}},
+            {'type': 'text', 'text': dynamic}
+        ]
+    
+    def _summarize_changes(self, changes: List[Dict]) -> Dict[str, Any]:
+        """Aggregate changes into a fixed-size summary for the prompt"""
+        return {
+            'by_domain': Counter(c.get('domain') for c in changes),
+            'top_entities': Counter(c.get('entity_id') for c in changes).most_common(5),
+            'exemplars': changes if len(changes) <= 6 else changes[:3] + changes[-3:]
+        }
+    
+    def _format_change(self, change: Dict) -> str:
+        """Format a single change for the prompt (domain is implied by entity_id)"""
+        return f"""
+{change.get('entity_id')}: {change.get('old_state')} → {change.get('new_state')} @ {change.get('last_changed')}"""
     
-    async def _mock_claude_analysis(self, prompt: str, changes: List[Dict]) -> str:
+    def _get_static_prefix(self, scope: List[str]) -> str:
+        """Get the cacheable instruction prefix for a monitoring scope"""
+        return _static_prefix(tuple(sorted(scope)), self._templates_key, self.insight_threshold)
+    
+    async def _mock_claude_analysis(self, prompt: List[Dict[str, Any]], changes: List[Dict]) -> Dict[str, Any]:
         """Mock Claude analysis for development/testing"""
         # TODO: Replace with actual Anthropic API call
         
         # Simple mock analysis based on change patterns
-        analysis = "Analysis Status: Normal\n"
-        analysis += f"Processed {len(changes)} state changes.\n"
+        insights = [f"Processed {len(changes)} state changes."]
         
-        # Check for concerning patterns
-        security_changes = [c for c in changes if 'door' in c.get('entity_id', '') or 'lock' in c.get('entity_id', '')]
-        if security_changes:
-            analysis += f"Security activity detected: {len(security_changes)} security-related changes.\n"
+        # Check for concerning patterns (single pass over changes)
+        security_count = 0
+        energy_count = 0
+        for change in changes:
+            entity_id = change.get('entity_id', '')
+            if 'door' in entity_id or 'lock' in entity_id:
+                security_count += 1
+            if 'power' in entity_id or 'energy' in entity_id:
+                energy_count += 1
         
-        energy_changes = [c for c in changes if 'power' in c.get('entity_id', '') or 'energy' in c.get('entity_id', '')]
-        if energy_changes:
-            analysis += f"Energy monitoring: {len(energy_changes)} power-related changes.\n"
+        if security_count:
+            insights.append(f"Security activity detected: {security_count} security-related changes.")
         
-        analysis += "Confidence: 0.7\n"
-        analysis += "Attention Required: False\n"
+        if energy_count:
+            insights.append(f"Energy monitoring: {energy_count} power-related changes.")
         
-        return analysis
+        return {
+            'requires_attention': False,
+            'confidence': 0.7,
+            'insights': insights,
+            'tokens': sum(len(insight.split()) for insight in insights)
+        }
     
-    def _structure_analysis(self, analysis_result: str, changes: List[Dict]) -> Dict[str, Any]:
+    def _structure_analysis(self, analysis_result, changes: List[Dict]) -> Dict[str, Any]:
         """Structure the analysis result into a standard format"""
         
-        # Parse mock analysis result
-        lines = analysis_result.split('\n')
-        
-        requires_attention = False
-        confidence = 0.7
-        insights = []
-        
-        for line in lines:
-            if 'Attention Required: True' in line:
-                requires_attention = True
-            elif 'Confidence:' in line:
+        # Structured results (mock, or a JSON response) need no parsing
+        if isinstance(analysis_result, dict):
+            requires_attention = analysis_result.get('requires_attention', False)
+            confidence = analysis_result.get('confidence', 0.7)
+            insights = analysis_result.get('insights', [])
+            tokens = analysis_result.get('tokens', 0)
+        else:
+            # Parse free-text analysis result
+            match = self._ATTENTION_RE.search(analysis_result)
+            requires_attention = bool(match and match.group(1).lower() == 'true')
+            
+            confidence = 0.7
+            match = self._CONFIDENCE_RE.search(analysis_result)
+            if match:
                 try:
-                    confidence = float(line.split(':')[1].strip())
-                except:
+                    confidence = float(match.group(1))
+                except ValueError:
                     confidence = 0.7
-            elif line.strip() and not line.startswith('Analysis Status:'):
-                insights.append(line.strip())
+            
+            insights = [
+                line.strip() for line in analysis_result.splitlines()
+                if line.strip() and not line.startswith(self._NON_INSIGHT_PREFIXES)
+            ]
+            tokens = len(analysis_result.split())
         
         return {
             'requires_attention': requires_attention and confidence > self.insight_threshold,
@@ -149,7 +323,7 @@ Be concise but thorough. Only flag for attention if confidence > {self.insight_t
             'changes_analyzed': len(changes),
             'cost_info': {
                 'model': self.model,
-                'estimated_tokens': len(analysis_result.split()),
+                'estimated_tokens': tokens,
                 'estimated_cost': 0.001  # Mock cost
             }
         }
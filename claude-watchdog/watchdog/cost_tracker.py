@@ -2,42 +2,90 @@
 Cost tracking and API usage management
 """
 
+import asyncio
 import json
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, Optional
 import os
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Seconds between fsyncs of the append-only event log
+EVENT_FLUSH_INTERVAL = 5.0
+
+# Per-day request log length when keep_request_log is enabled
+REQUEST_LOG_SIZE = 100
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes (orjson when available); deques become lists"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=list)
+    return json.dumps(obj, separators=(',', ':'), default=list).encode()
+
+
+_loads = orjson.loads if orjson is not None else json.loads
+
 class CostTracker:
     """Track API costs and usage to stay within limits"""
     
-    def __init__(self, data_dir: str, daily_limit: float = 1.00, max_calls: int = 1000):
+    def __init__(self, data_dir: str, daily_limit: float = 1.00, max_calls: int = 1000, keep_request_log: bool = False):
         self.data_dir = data_dir
         self.daily_limit = daily_limit
         self.max_calls = max_calls
+        # Debug detail: keep the last REQUEST_LOG_SIZE requests per day
+        self.keep_request_log = keep_request_log
         self.cost_file = os.path.join(data_dir, 'costs', 'daily_costs.json')
+        self.events_file = os.path.join(data_dir, 'costs', 'cost_events.jsonl')
+        
+        self._today_day = -1
+        self._today_date = None
+        self._today_str = ''
+        self._ts_second = -1
+        self._ts_prefix = ''
         
         # Ensure costs directory exists
         os.makedirs(os.path.dirname(self.cost_file), exist_ok=True)
         
-        # Load or initialize cost data
+        # Load the daily totals snapshot, then replay events logged since it was written
         self.cost_data = self._load_cost_data()
+        self._replay_events()
+        
+        # Requests are appended to the event log; the snapshot is only
+        # rewritten on day rollover and shutdown
+        self._events_fp = open(self.events_file, 'ab', buffering=8192)
+        # Events written since the last fsync, which only the flush task and close() do
+        self._unsynced = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._current_day = self._today()
     
     def _load_cost_data(self) -> Dict[str, Any]:
         """Load existing cost data or create new"""
         try:
             if os.path.exists(self.cost_file):
-                with open(self.cost_file, 'r') as f:
-                    data = json.load(f)
+                with open(self.cost_file, 'rb') as f:
+                    data = _loads(f.read())
                     
                 # Clean old data (keep last 30 days)
-                cutoff = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+                cutoff = (datetime.now(timezone.utc) - timedelta(days=30)).strftime('%Y-%m-%d')
                 data['daily_costs'] = {
                     date: costs for date, costs in data.get('daily_costs', {}).items()
                     if date >= cutoff
                 }
+                
+                if self.keep_request_log:
+                    for costs in data['daily_costs'].values():
+                        costs['requests'] = deque(costs.get('requests', []), maxlen=REQUEST_LOG_SIZE)
+                else:
+                    for costs in data['daily_costs'].values():
+                        costs.pop('requests', None)
                 return data
         except Exception as e:
             logger.error(f"Error loading cost data: {e}")
@@ -45,61 +93,182 @@ class CostTracker:
         return {
             'daily_costs': {},
             'monthly_total': 0.0,
-            'last_reset': datetime.now().strftime('%Y-%m-%d')
+            'last_reset': self._today(),
+            'events_offset': 0
         }
     
+    def _today(self) -> str:
+        """Today's UTC date as YYYY-MM-DD, reformatted only when the day changes"""
+        day = int(time.time()) // 86400
+        if day != self._today_day:
+            self._today_day = day
+            self._today_date = datetime.fromtimestamp(day * 86400, timezone.utc).date()
+            self._today_str = self._today_date.isoformat()
+        return self._today_str
+    
+    def _timestamp(self) -> str:
+        """Current UTC ISO timestamp, reformatting the date/time part once per second"""
+        now = time.time()
+        second = int(now)
+        if second != self._ts_second:
+            self._ts_second = second
+            self._ts_prefix = datetime.fromtimestamp(second, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+        return f"{self._ts_prefix}.{int((now - second) * 1e6):06d}+00:00"
+    
+    def _replay_events(self):
+        """Apply event log entries not yet folded into the snapshot"""
+        try:
+            size = os.path.getsize(self.events_file)
+        except OSError:
+            return
+        
+        # An offset past the end means the log was truncated after the snapshot
+        offset = min(self.cost_data.get('events_offset', 0), size)
+        if offset == size:
+            return
+        
+        replayed = 0
+        try:
+            with open(self.events_file, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        self._apply_event(_loads(line))
+                        replayed += 1
+                    except (ValueError, KeyError):
+                        # Skip a partially written trailing line
+                        continue
+        except Exception as e:
+            logger.error(f"Error replaying cost events: {e}")
+        
+        logger.info(f"Replayed {replayed} cost events from {self.events_file}")
+    
     def _save_cost_data(self):
-        """Save cost data to file"""
+        """Save cost data snapshot to file"""
+        tmp_file = self.cost_file + '.tmp'
         try:
-            os.makedirs(os.path.dirname(self.cost_file), exist_ok=True)
-            with open(self.cost_file, 'w') as f:
-                json.dump(self.cost_data, f, indent=2)
+            try:
+                with open(tmp_file, 'wb') as f:
+                    f.write(_dumps(self.cost_data))
+            except FileNotFoundError:
+                # Directory is created in __init__; only recreate if removed since
+                os.makedirs(os.path.dirname(self.cost_file), exist_ok=True)
+                with open(tmp_file, 'wb') as f:
+                    f.write(_dumps(self.cost_data))
+            os.replace(tmp_file, self.cost_file)
         except Exception as e:
             logger.error(f"Error saving cost data: {e}")
     
-    def record_request(self, cost_info: Dict[str, Any]):
-        """Record an API request and its cost"""
-        today = datetime.now().strftime('%Y-%m-%d')
+    async def _sync_events(self):
+        """Hand buffered events to the OS, then fsync them in a worker thread"""
+        self._events_fp.flush()
+        self._unsynced = False
+        await asyncio.to_thread(os.fsync, self._events_fp.fileno())
+    
+    def start_flush_task(self):
+        """Start fsyncing events every EVENT_FLUSH_INTERVAL seconds; call from the event loop"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+    
+    async def _flush_loop(self):
+        """Sync events left in the buffer after the last request of a burst"""
+        while True:
+            await asyncio.sleep(EVENT_FLUSH_INTERVAL)
+            if not self._unsynced:
+                continue
+            try:
+                await self._sync_events()
+            except Exception as e:
+                logger.error(f"Error flushing cost events: {e}")
+    
+    def _rotate_events(self):
+        """Fold the event log into the snapshot and start a fresh log"""
+        try:
+            self._events_fp.flush()
+            self.cost_data['events_offset'] = self._events_fp.tell()
+            self._save_cost_data()
+            self._events_fp.truncate(0)
+            self.cost_data['events_offset'] = 0
+            self._save_cost_data()
+        except Exception as e:
+            logger.error(f"Error rotating cost events: {e}")
+    
+    def _apply_event(self, event: Dict[str, Any]):
+        """Apply a single request event to the in-memory daily totals"""
+        date = event['date']
         
-        if today not in self.cost_data['daily_costs']:
-            self.cost_data['daily_costs'][today] = {
+        daily_data = self.cost_data['daily_costs'].get(date)
+        if daily_data is None:
+            daily_data = self.cost_data['daily_costs'][date] = {
                 'total_cost': 0.0,
                 'request_count': 0,
-                'tokens_used': 0,
-                'requests': []
+                'tokens_used': 0
             }
         
-        daily_data = self.cost_data['daily_costs'][today]
+        # Update daily totals
+        daily_data['total_cost'] += event['cost']
+        daily_data['request_count'] += 1
+        daily_data['tokens_used'] += event['tokens']
+        
+        # Record individual request (bounded, oldest dropped first)
+        if self.keep_request_log:
+            requests = daily_data.get('requests')
+            if requests is None:
+                requests = daily_data['requests'] = deque(maxlen=REQUEST_LOG_SIZE)
+            requests.append({
+                'timestamp': event.get('timestamp'),
+                'model': event['model'],
+                'tokens': event['tokens'],
+                'cost': event['cost']
+            })
+    
+    def record_request(self, cost_info: Dict[str, Any]):
+        """Record an API request and its cost"""
+        today = self._today()
+        
+        if today != self._current_day:
+            self._rotate_events()
+            self._current_day = today
         
         # Extract cost information
         estimated_cost = cost_info.get('estimated_cost', 0.0)
         tokens = cost_info.get('estimated_tokens', 0)
-        model = cost_info.get('model', 'unknown')
         
-        # Update daily totals
-        daily_data['total_cost'] += estimated_cost
-        daily_data['request_count'] += 1
-        daily_data['tokens_used'] += tokens
-        
-        # Record individual request
-        daily_data['requests'].append({
-            'timestamp': datetime.now().isoformat(),
-            'model': model,
+        event = {
+            'date': today,
+            'model': cost_info.get('model', 'unknown'),
             'tokens': tokens,
             'cost': estimated_cost
-        })
-        
-        # Keep only last 100 requests per day
-        if len(daily_data['requests']) > 100:
-            daily_data['requests'] = daily_data['requests'][-100:]
+        }
+        # Timestamps are only needed for the optional per-request log
+        if self.keep_request_log:
+            event['timestamp'] = self._timestamp()
+        self._apply_event(event)
         
-        self._save_cost_data()
+        try:
+            self._events_fp.write(_dumps(event) + b'\n')
+            self._unsynced = True
+        except Exception as e:
+            logger.error(f"Error writing cost event: {e}")
         
         logger.debug(f"Recorded API request: ${estimated_cost:.4f}, {tokens} tokens")
     
+    async def close(self):
+        """Flush pending events and write a final snapshot"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        try:
+            await self._sync_events()
+            self.cost_data['events_offset'] = self._events_fp.tell()
+            await asyncio.to_thread(self._save_cost_data)
+            self._events_fp.close()
+        except Exception as e:
+            logger.error(f"Error closing cost tracker: {e}")
+    
     def can_make_request(self) -> bool:
         """Check if we can make another API request within limits"""
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = self._today()
         
         if today not in self.cost_data['daily_costs']:
             return True
@@ -121,7 +290,7 @@ class CostTracker:
     def get_daily_usage(self, date: str = None) -> Dict[str, Any]:
         """Get usage statistics for a specific date"""
         if date is None:
-            date = datetime.now().strftime('%Y-%m-%d')
+            date = self._today()
         
         return self.cost_data['daily_costs'].get(date, {
             'total_cost': 0.0,
@@ -132,16 +301,16 @@ class CostTracker:
     
     def get_usage_summary(self) -> Dict[str, Any]:
         """Get overall usage summary"""
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = self._today()
         daily_usage = self.get_daily_usage(today)
         
         # Calculate week and month totals
         week_total = 0.0
         month_total = 0.0
+        today_date = self._today_date
         
-        for date, data in self.cost_data['daily_costs'].items():
-            date_obj = datetime.strptime(date, '%Y-%m-%d')
-            days_ago = (datetime.now() - date_obj).days
+        for date_str, data in self.cost_data['daily_costs'].items():
+            days_ago = (today_date - date.fromisoformat(date_str)).days
             
             if days_ago <= 7:
                 week_total += data.get('total_cost', 0.0)
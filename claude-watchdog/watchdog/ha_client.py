@@ -4,34 +4,130 @@ Home Assistant API client for state monitoring
 
 import aiohttp
 import asyncio
+import json
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+import re
+import time
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Any, Optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+def _dumps(obj: Any) -> bytes:
+    """Encode a request body as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+# Process-wide HTTP session shared by all clients (same HA host, many polls)
+_SESSION: Optional[aiohttp.ClientSession] = None
+_SESSION_LOCK = asyncio.Lock()
+_SESSION_USERS = 0
+
+# How long the scoped entity list is reused before /api/states is re-read
+SCOPE_ENTITY_TTL = 60.0
+# Entities per history request; keeps filter_entity_id under HA's URL limit
+HISTORY_CHUNK_SIZE = 150
+
+# Scope -> domains considered when extracting history changes ('*' = all)
+_SCOPE_DOMAINS = {
+    'climate': frozenset({'climate', 'weather', 'sensor'}),
+    'security': frozenset({'binary_sensor', 'alarm_control_panel', 'lock', 'camera'}),
+    'energy': frozenset({'sensor', 'switch', 'light'}),
+    'automation_performance': frozenset({'automation', 'script'}),
+    'device_health': frozenset({'sensor', 'binary_sensor'}),
+    'patterns': frozenset({'*'})  # All entities for pattern analysis
+}
+
+# Inverted table: domain -> scopes that include it
+_DOMAIN_TO_SCOPES = {
+    domain: frozenset(scope for scope, domains in _SCOPE_DOMAINS.items() if domain in domains)
+    for domain in frozenset().union(*_SCOPE_DOMAINS.values()) - {'*'}
+}
+
+def _scope_matches_everything(scope) -> bool:
+    """True when the scope admits every entity, so filtering can be skipped"""
+    return not scope or 'patterns' in scope or 'all' in scope
+
+@lru_cache(maxsize=16384)
+def _entity_in_scope_cached(entity_id: str, scope_key: tuple) -> bool:
+    """Scope membership for an entity; scope_key is tuple(sorted(scope))"""
+    if _scope_matches_everything(scope_key):
+        return True
+    domain, _, _ = entity_id.partition('.')
+    return not _DOMAIN_TO_SCOPES.get(domain, frozenset()).isdisjoint(scope_key)
+
 class HomeAssistantClient:
     """Client for interacting with Home Assistant API"""
     
+    # Scope -> (allowed domains, entity_id keyword pattern or None for any)
+    SCOPE_FILTERS = {
+        'climate': (frozenset({'climate', 'weather', 'sensor'}), re.compile(r'temperature|humidity|climate|thermostat')),
+        'security': (frozenset({'binary_sensor', 'alarm_control_panel', 'lock', 'camera'}), re.compile(r'door|window|motion|alarm|lock|security')),
+        'energy': (frozenset({'sensor', 'switch', 'light'}), re.compile(r'power|energy|consumption|watt')),
+        'automation_performance': (frozenset({'automation', 'script'}), None)
+    }
+    
     def __init__(self, url: str, token: str):
         self.url = url.rstrip('/')
         self.token = token
         self.session = None
+        # Bound concurrent history chunk requests to respect HA's connection limits
+        self._history_semaphore = asyncio.Semaphore(8)
+        self._scope_entity_cache = None  # (expires_at, scope_key, entity_ids)
         self.headers = {
             'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json'
         }
     
     async def _get_session(self):
-        """Get or create HTTP session"""
+        """Get the shared HTTP session, creating it on first use"""
+        global _SESSION, _SESSION_USERS
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            async with _SESSION_LOCK:
+                if _SESSION is None or _SESSION.closed:
+                    connector = aiohttp.TCPConnector(limit=32, limit_per_host=32, ttl_dns_cache=300, keepalive_timeout=75)
+                    _SESSION = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=aiohttp.ClientTimeout(total=30, connect=5)
+                    )
+                _SESSION_USERS += 1
+                self.session = _SESSION
         return self.session
     
+    async def _async_setup(self):
+        """Open the connection to HA ahead of first use and check the token"""
+        try:
+            session = await self._get_session()
+            async with session.get(f'{self.url}/api/', headers=self.headers) as response:
+                if response.status != 200:
+                    logger.warning(f"Home Assistant API check failed: {response.status}")
+        except Exception as e:
+            logger.warning(f"Home Assistant API not reachable yet: {e}")
+    
+    async def _read_json(self, response) -> Any:
+        """Decode a JSON response body, using orjson's C parser when available"""
+        if orjson is not None:
+            return orjson.loads(await response.read())
+        return await response.json()
+    
     async def close(self):
-        """Close HTTP session"""
-        if self.session:
-            await self.session.close()
+        """Release the shared HTTP session; the last client closes it"""
+        global _SESSION, _SESSION_USERS
+        if self.session is None:
+            return
+        async with _SESSION_LOCK:
+            self.session = None
+            _SESSION_USERS -= 1
+            if _SESSION_USERS <= 0 and _SESSION is not None:
+                await _SESSION.close()
+                _SESSION = None
+                _SESSION_USERS = 0
     
     async def get_current_state(self, scope: List[str] = None) -> Dict[str, Any]:
         """Get current state of all entities or filtered by scope"""
@@ -39,10 +135,10 @@ class HomeAssistantClient:
             session = await self._get_session()
             async with session.get(f'{self.url}/api/states', headers=self.headers) as response:
                 if response.status == 200:
-                    entities = await response.json()
+                    entities = await self._read_json(response)
                     
-                    # Filter by monitoring scope if provided
-                    if scope:
+                    # Filter by monitoring scope unless it admits everything
+                    if not _scope_matches_everything(scope):
                         filtered = self._filter_entities_by_scope(entities, scope)
                         return {entity['entity_id']: entity for entity in filtered}
                     
@@ -55,57 +151,125 @@ class HomeAssistantClient:
             logger.error(f"Error getting current state: {e}")
             return {}
     
+    async def _scoped_entity_ids(self, scope: List[str]) -> List[str]:
+        """Entity ids in the monitoring scope, cached for SCOPE_ENTITY_TTL seconds"""
+        scope_key = tuple(sorted(scope))
+        now = time.monotonic()
+        cached = self._scope_entity_cache
+        if cached and cached[0] > now and cached[1] == scope_key:
+            return cached[2]
+        
+        session = await self._get_session()
+        async with session.get(f'{self.url}/api/states', headers=self.headers) as response:
+            if response.status != 200:
+                logger.error(f"Failed to get states: {response.status}")
+                return cached[2] if cached and cached[1] == scope_key else []
+            entities = await self._read_json(response)
+        
+        entity_ids = [
+            entity['entity_id'] for entity in entities
+            if _entity_in_scope_cached(entity.get('entity_id', ''), scope_key)
+        ]
+        self._scope_entity_cache = (now + SCOPE_ENTITY_TTL, scope_key, entity_ids)
+        return entity_ids
+    
     async def get_recent_changes(self, since: Optional[datetime] = None, scope: List[str] = None) -> List[Dict]:
         """Get recent state changes from history"""
         if since is None:
-            since = datetime.now() - timedelta(minutes=5)
+            since = datetime.now(timezone.utc) - timedelta(minutes=5)
         
         try:
             # Use history API to get changes
             session = await self._get_session()
             since_iso = since.isoformat()
             
-            async with session.get(
-                f'{self.url}/api/history/period/{since_iso}',
-                headers=self.headers
-            ) as response:
-                if response.status == 200:
-                    history = await response.json()
-                    changes = self._extract_changes_from_history(history, scope)
-                    logger.debug(f"Found {len(changes)} state changes since {since_iso}")
-                    return changes
-                else:
-                    logger.error(f"Failed to get history: {response.status}")
+            # Filter server-side so HA only returns history for scoped entities
+            chunks = [None]
+            if not _scope_matches_everything(scope):
+                entity_ids = await self._scoped_entity_ids(scope)
+                if not entity_ids:
                     return []
+                chunks = [
+                    entity_ids[i:i + HISTORY_CHUNK_SIZE]
+                    for i in range(0, len(entity_ids), HISTORY_CHUNK_SIZE)
+                ]
+            
+            async def _fetch_chunk(chunk: Optional[List[str]]) -> List[List[Dict]]:
+                # Only state/last_changed are used, so skip attributes server-side
+                chunk_params = {'minimal_response': '1', 'no_attributes': '1'}
+                if chunk is not None:
+                    chunk_params['filter_entity_id'] = ','.join(chunk)
+                async with self._history_semaphore:
+                    async with session.get(
+                        f'{self.url}/api/history/period/{since_iso}',
+                        headers=self.headers,
+                        params=chunk_params
+                    ) as response:
+                        if response.status == 200:
+                            return await self._read_json(response)
+                        logger.warning(
+                            f"History chunk failed: {response.status}"
+                            + (f" for {len(chunk)} entities" if chunk is not None else "")
+                        )
+                        return []
+            
+            # Fetch all chunks concurrently; a failed chunk doesn't sink the others
+            results = await asyncio.gather(*[_fetch_chunk(chunk) for chunk in chunks], return_exceptions=True)
+            history = []
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning(f"History chunk error: {result}")
+                    continue
+                history.extend(result)
+            
+            # Scope was already applied by the server (or covers everything)
+            changes = self._extract_changes_from_history(history)
+            logger.debug(f"Found {len(changes)} state changes since {since_iso}")
+            return changes
                     
         except Exception as e:
             logger.error(f"Error getting recent changes: {e}")
             return []
     
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _domain_filters(scope_key: tuple) -> Dict[str, Optional[re.Pattern]]:
+        """Domain -> combined keyword pattern for the given scopes (None matches any id)"""
+        keywords: Dict[str, List[str]] = {}
+        match_any = set()
+        for scope_item in scope_key:
+            if scope_item not in HomeAssistantClient.SCOPE_FILTERS:
+                continue
+            domains, pattern = HomeAssistantClient.SCOPE_FILTERS[scope_item]
+            for domain in domains:
+                if pattern is None:
+                    match_any.add(domain)
+                else:
+                    keywords.setdefault(domain, []).append(pattern.pattern)
+        
+        filters: Dict[str, Optional[re.Pattern]] = {domain: None for domain in match_any}
+        for domain, patterns in keywords.items():
+            if domain not in match_any:
+                filters[domain] = re.compile('|'.join(patterns))
+        return filters
+    
     def _filter_entities_by_scope(self, entities: List[Dict], scope: List[str]) -> List[Dict]:
         """Filter entities based on monitoring scope"""
-        if not scope:
+        if _scope_matches_everything(scope):
             return entities
         
+        domain_filters = self._domain_filters(tuple(sorted(scope)))
+        
         filtered = []
         for entity in entities:
             entity_id = entity.get('entity_id', '')
-            domain = entity_id.split('.')[0] if '.' in entity_id else ''
-            
-            # Map scope to domains
-            if 'climate' in scope and domain in ['climate', 'weather', 'sensor']:
-                if any(keyword in entity_id.lower() for keyword in ['temperature', 'humidity', 'climate', 'thermostat']):
-                    filtered.append(entity)
-            
-            if 'security' in scope and domain in ['binary_sensor', 'alarm_control_panel', 'lock', 'camera']:
-                if any(keyword in entity_id.lower() for keyword in ['door', 'window', 'motion', 'alarm', 'lock', 'security']):
-                    filtered.append(entity)
+            domain, _, _ = entity_id.partition('.')
             
-            if 'energy' in scope and domain in ['sensor', 'switch', 'light']:
-                if any(keyword in entity_id.lower() for keyword in ['power', 'energy', 'consumption', 'watt']):
-                    filtered.append(entity)
-            
-            if 'automation_performance' in scope and domain in ['automation', 'script']:
+            # Domains no requested scope covers are skipped without a keyword scan
+            if domain not in domain_filters:
+                continue
+            pattern = domain_filters[domain]
+            if pattern is None or pattern.search(entity_id.lower()):
                 filtered.append(entity)
         
         return filtered
@@ -113,6 +277,7 @@ class HomeAssistantClient:
     def _extract_changes_from_history(self, history: List[List[Dict]], scope: List[str] = None) -> List[Dict]:
         """Extract meaningful changes from history data"""
         changes = []
+        scope_key = tuple(sorted(scope)) if scope else None
         
         for entity_history in history:
             if not entity_history:
@@ -120,46 +285,82 @@ class HomeAssistantClient:
                 
             entity_id = entity_history[0].get('entity_id', '')
             
-            # Skip if not in monitoring scope
-            if scope and not self._entity_in_scope(entity_id, scope):
+            # Skip if not in monitoring scope (membership is per entity, not per sample)
+            if scope_key and not _entity_in_scope_cached(entity_id, scope_key):
                 continue
             
-            # Look for state changes
-            for i in range(1, len(entity_history)):
-                prev_state = entity_history[i-1]
-                curr_state = entity_history[i]
-                
-                if prev_state.get('state') != curr_state.get('state'):
+            domain = entity_id.partition('.')[0] if '.' in entity_id else ''
+            
+            # Look for state changes by comparing adjacent states in one pass
+            states = [s.get('state') for s in entity_history]
+            for i, (old_state, new_state) in enumerate(zip(states, states[1:]), 1):
+                if old_state != new_state:
+                    curr_state = entity_history[i]
                     changes.append({
                         'entity_id': entity_id,
-                        'old_state': prev_state.get('state'),
-                        'new_state': curr_state.get('state'),
+                        'old_state': old_state,
+                        'new_state': new_state,
                         'last_changed': curr_state.get('last_changed'),
-                        'attributes': curr_state.get('attributes', {}),
-                        'domain': entity_id.split('.')[0] if '.' in entity_id else ''
+                        'domain': domain
                     })
         
         return changes
     
     def _entity_in_scope(self, entity_id: str, scope: List[str]) -> bool:
         """Check if entity is in monitoring scope"""
-        domain = entity_id.split('.')[0] if '.' in entity_id else ''
+        return _entity_in_scope_cached(entity_id, tuple(sorted(scope)))
+    
+    async def stream_state_changes(self, scope: List[str] = None) -> AsyncIterator[Dict]:
+        """Yield scoped state changes as HA pushes them over the websocket API
         
-        scope_domains = {
-            'climate': ['climate', 'weather', 'sensor'],
-            'security': ['binary_sensor', 'alarm_control_panel', 'lock', 'camera'],
-            'energy': ['sensor', 'switch', 'light'],
-            'automation_performance': ['automation', 'script'],
-            'device_health': ['sensor', 'binary_sensor'],
-            'patterns': ['*']  # All entities for pattern analysis
-        }
+        Changes use the same shape as _extract_changes_from_history. Raises on
+        authentication failure or when the connection drops; callers reconnect.
+        """
+        session = await self._get_session()
+        ws_url = re.sub(r'^http', 'ws', self.url) + '/api/websocket'
+        scope_key = tuple(sorted(scope)) if scope else None
+        loads = orjson.loads if orjson is not None else json.loads
         
-        for scope_item in scope:
-            if scope_item in scope_domains:
-                if '*' in scope_domains[scope_item] or domain in scope_domains[scope_item]:
-                    return True
+        async with session.ws_connect(ws_url, heartbeat=30) as ws:
+            msg = await ws.receive_json(loads=loads)
+            if msg.get('type') == 'auth_required':
+                await ws.send_json({'type': 'auth', 'access_token': self.token})
+                msg = await ws.receive_json(loads=loads)
+            if msg.get('type') != 'auth_ok':
+                raise ConnectionError(f"Websocket authentication failed: {msg.get('message', msg.get('type'))}")
+            
+            await ws.send_json({'id': 1, 'type': 'subscribe_events', 'event_type': 'state_changed'})
+            logger.info("Subscribed to state_changed events")
+            
+            async for ws_msg in ws:
+                if ws_msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                msg = loads(ws_msg.data)
+                if msg.get('type') != 'event':
+                    if msg.get('type') == 'result' and not msg.get('success', True):
+                        raise ConnectionError(f"Event subscription failed: {msg.get('error')}")
+                    continue
+                
+                data = msg['event'].get('data', {})
+                entity_id = data.get('entity_id', '')
+                if scope_key and not _entity_in_scope_cached(entity_id, scope_key):
+                    continue
+                
+                old = data.get('old_state') or {}
+                new = data.get('new_state') or {}
+                # Attribute-only updates don't count as changes, as in history extraction
+                if old.get('state') == new.get('state'):
+                    continue
+                
+                yield {
+                    'entity_id': entity_id,
+                    'old_state': old.get('state'),
+                    'new_state': new.get('state'),
+                    'last_changed': new.get('last_changed'),
+                    'domain': entity_id.partition('.')[0]
+                }
         
-        return False
+        raise ConnectionError("Websocket closed")
     
     async def send_notification(self, service: str, message: str, title: str = "Claude Watchdog", **kwargs):
         """Send notification through Home Assistant"""
@@ -175,7 +376,7 @@ class HomeAssistantClient:
             async with session.post(
                 f'{self.url}/api/services/notify/{service}',
                 headers=self.headers,
-                json=payload
+                data=_dumps(payload)
             ) as response:
                 if response.status == 200:
                     logger.info(f"Notification sent via {service}")
@@ -5,12 +5,22 @@ Main monitoring service that runs continuously
 """
 
 import asyncio
+import json
 import os
 import sys
 import signal
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, FrozenSet, Any
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from watchdog_monitor import WatchdogMonitor
 from ha_client import HomeAssistantClient
@@ -29,6 +39,34 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Values accepted in WATCHDOG_MONITORING_SCOPE ('all' admits every entity)
+_KNOWN_SCOPES = frozenset({
+    'climate', 'security', 'energy', 'automation_performance', 'device_health', 'patterns', 'all'
+})
+_DEFAULT_SCOPE = frozenset({'climate', 'security', 'energy'})
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+@lru_cache(maxsize=1)
+def _parse_monitoring_scope_impl(env_value: str) -> FrozenSet[str]:
+    """Parse and validate a JSON list of scope names"""
+    try:
+        parsed = _loads(env_value)
+    except ValueError:
+        logger.warning(f"Invalid monitoring scope {env_value!r}, using defaults")
+        return _DEFAULT_SCOPE
+    if not isinstance(parsed, list):
+        logger.warning(f"Monitoring scope must be a list, got {env_value!r}; using defaults")
+        return _DEFAULT_SCOPE
+    
+    scope = frozenset(s for s in parsed if isinstance(s, str) and s in _KNOWN_SCOPES)
+    unknown = [s for s in parsed if not (isinstance(s, str) and s in _KNOWN_SCOPES)]
+    if unknown:
+        logger.warning(f"Ignoring unknown monitoring scopes: {unknown}")
+        if not scope:
+            return _DEFAULT_SCOPE
+    return scope
+
 class ClaudeWatchdogService:
     """Main service class for Claude Watchdog"""
     
@@ -59,14 +97,9 @@ class ClaudeWatchdogService:
             'ha_token': os.getenv('HASSIO_TOKEN', '')
         }
     
-    def _parse_monitoring_scope(self) -> List[str]:
+    def _parse_monitoring_scope(self) -> FrozenSet[str]:
         """Parse monitoring scope from environment"""
-        scope_str = os.getenv('WATCHDOG_MONITORING_SCOPE', '["climate","security","energy"]')
-        try:
-            import json
-            return json.loads(scope_str)
-        except:
-            return ["climate", "security", "energy"]
+        return _parse_monitoring_scope_impl(os.getenv('WATCHDOG_MONITORING_SCOPE', '["climate","security","energy"]'))
     
     async def initialize(self):
         """Initialize all service components"""
@@ -85,19 +118,24 @@ class ClaudeWatchdogService:
                 insight_threshold=self.config['insight_threshold']
             )
             
-            # Initialize cost tracker
-            self.cost_tracker = CostTracker(
-                data_dir=self.config['data_dir'],
-                daily_limit=self.config['cost_limit'],
-                max_calls=self.config['max_daily_calls']
-            )
-            
-            # Initialize insight manager
-            self.insight_manager = InsightManager(
-                data_dir=self.config['data_dir'],
-                ha_client=self.ha_client,
-                notification_service=self.config['notification_service']
+            # Cost tracker and insight manager load their files from disk; build
+            # them in worker threads while the HA connection is warmed up
+            self.cost_tracker, self.insight_manager, _ = await asyncio.gather(
+                asyncio.to_thread(
+                    CostTracker,
+                    data_dir=self.config['data_dir'],
+                    daily_limit=self.config['cost_limit'],
+                    max_calls=self.config['max_daily_calls']
+                ),
+                asyncio.to_thread(
+                    InsightManager,
+                    data_dir=self.config['data_dir'],
+                    ha_client=self.ha_client,
+                    notification_service=self.config['notification_service']
+                ),
+                self.ha_client._async_setup()
             )
+            self.cost_tracker.start_flush_task()
             
             # Initialize main monitor
             self.monitor = WatchdogMonitor(
@@ -145,6 +183,15 @@ class ClaudeWatchdogService:
         
         if self.monitor:
             await self.monitor.stop_monitoring()
+        
+        if self.insight_manager:
+            await self.insight_manager.force_flush()
+        
+        if self.cost_tracker:
+            await self.cost_tracker.close()
+        
+        if self.ha_client:
+            await self.ha_client.close()
 
 # Service entry point
 async def main():
@@ -162,4 +209,7 @@ async def main():
         await service.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # libuv-backed event loop when available: lower per-callback and socket I/O overhead
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(main())
\ No newline at end of file
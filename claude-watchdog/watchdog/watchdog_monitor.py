@@ -3,12 +3,35 @@ Core monitoring loop and state management
 """
 
 import asyncio
+import bisect
 import logging
-from datetime import datetime, timedelta
+import os
+import random
+import time
+from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Quiet period used to gather a burst of pushed changes into one analysis
+STREAM_DEBOUNCE = 5.0
+# Pending pushed changes held while an analysis is running
+STREAM_QUEUE_SIZE = 1000
+# Upper bound on the websocket reconnect delay
+STREAM_RECONNECT_MAX = 60
+# A repeat of an (entity, old state, new state) transition within this many seconds isn't re-analyzed
+DEDUPE_WINDOW = 600
+# Every transition in these domains is analyzed; a re-opened door or re-unlocked lock is news.
+# Binary sensor device classes aren't carried on changes, so the whole domain is exempt
+DEDUPE_EXEMPT_DOMAINS = frozenset({'lock', 'alarm_control_panel', 'binary_sensor'})
+# Longest pause, in seconds, after consecutive failed cycles (doubling from check_interval)
+ERROR_BACKOFF_MAX = 300
+# Log event-loop stalls (WATCHDOG_DEBUG_LOOP): probe every LOOP_PROBE_INTERVAL seconds
+# and warn when a probe wakes more than LOOP_LAG_WARN seconds late
+DEBUG_LOOP = os.getenv('WATCHDOG_DEBUG_LOOP', 'false').lower() == 'true'
+LOOP_PROBE_INTERVAL = 0.1
+LOOP_LAG_WARN = 0.2
+
 class WatchdogMonitor:
     """Main monitoring service that coordinates all watchdog activities"""
     
@@ -21,7 +44,11 @@ class WatchdogMonitor:
         
         self.running = False
         self.state_buffer = StateBuffer(max_size=1000)
+        self.deduper = ChangeDeduper(window=DEDUPE_WINDOW)
         self.last_check = None
+        self._change_queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._stream_task: Optional[asyncio.Task] = None
+        self._lag_task: Optional[asyncio.Task] = None
         
     async def start_monitoring(self):
         """Start the main monitoring loop"""
@@ -31,43 +58,122 @@ class WatchdogMonitor:
         # Initialize baseline state
         await self._establish_baseline()
         
-        # Start monitoring loop
+        # Changes are pushed by HA; batch them and analyze at most once per check_interval
+        self._stream_task = asyncio.create_task(self._stream_changes())
+        if DEBUG_LOOP:
+            self._lag_task = asyncio.create_task(self._loop_watchdog())
+        loop = asyncio.get_running_loop()
+        interval = self.config['check_interval']
+        fail_count = 0
+        
         while self.running:
             try:
-                await self._monitoring_cycle()
-                await asyncio.sleep(self.config['check_interval'])
+                try:
+                    first = await asyncio.wait_for(self._change_queue.get(), timeout=interval)
+                except asyncio.TimeoutError:
+                    continue
+                
+                batch_start = loop.time()
+                changes = [first]
+                while True:
+                    remaining = batch_start + STREAM_DEBOUNCE - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        changes.append(await asyncio.wait_for(self._change_queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError:
+                        break
+                while not self._change_queue.empty():
+                    changes.append(self._change_queue.get_nowait())
+                
+                await self._process_changes(changes, datetime.now(timezone.utc))
+                fail_count = 0
+                await asyncio.sleep(max(0.0, batch_start + interval - loop.time()))
                 
             except Exception as e:
-                logger.error(f"Monitoring cycle error: {e}")
-                await asyncio.sleep(self.config['check_interval'])
+                # Back off exponentially (with jitter) while HA or Claude keeps failing
+                fail_count += 1
+                delay = min(interval * 2 ** min(fail_count - 1, 16), ERROR_BACKOFF_MAX)
+                delay *= random.uniform(0.8, 1.2)
+                logger.error(f"Monitoring cycle error: {e}; retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
     
     async def stop_monitoring(self):
         """Stop the monitoring loop"""
         logger.info("Stopping monitoring loop...")
         self.running = False
+        
+        if self._lag_task:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._stream_task:
+            self._stream_task.cancel()
+            try:
+                await self._stream_task
+            except asyncio.CancelledError:
+                pass
+            self._stream_task = None
+    
+    async def _loop_watchdog(self):
+        """Warn when something blocks the event loop long enough to delay a short sleep"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            t0 = loop.time()
+            await asyncio.sleep(LOOP_PROBE_INTERVAL)
+            lag = loop.time() - t0 - LOOP_PROBE_INTERVAL
+            if lag > LOOP_LAG_WARN:
+                logger.warning(f"Event loop lag {lag:.3f}s")
     
-    async def _monitoring_cycle(self):
-        """Execute one monitoring cycle"""
-        cycle_start = datetime.now()
+    async def _stream_changes(self):
+        """Feed pushed state changes into the queue, reconnecting on failure"""
+        scope = self.config['monitoring_scope']
+        delay = 1
         
+        while self.running:
+            try:
+                async for change in self.ha_client.stream_state_changes(scope):
+                    delay = 1
+                    self._enqueue(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"State change stream interrupted: {e}; reconnecting in {delay}s")
+            
+            disconnected_at = datetime.now(timezone.utc)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STREAM_RECONNECT_MAX)
+            
+            # Recover anything that changed while the socket was down
+            try:
+                for change in await self.ha_client.get_recent_changes(since=disconnected_at, scope=scope):
+                    self._enqueue(change)
+            except Exception as e:
+                logger.warning(f"Failed to backfill changes after disconnect: {e}")
+    
+    def _enqueue(self, change: Dict):
+        """Queue a change for the next batch, dropping it if the queue is full"""
+        try:
+            self._change_queue.put_nowait(change)
+        except asyncio.QueueFull:
+            logger.debug(f"Change queue full, dropping change for {change.get('entity_id')}")
+    
+    async def _process_changes(self, changes: List[Dict], cycle_start: datetime):
+        """Analyze a batch of state changes and act on the result"""
         # Check if we're within cost/API limits
         if not self.cost_tracker.can_make_request():
-            logger.warning("Daily cost/API limit reached, skipping cycle")
+            logger.warning(f"Daily cost/API limit reached, skipping {len(changes)} changes")
             return
         
-        # Get recent state changes from Home Assistant
-        changes = await self.ha_client.get_recent_changes(
-            since=self.last_check,
-            scope=self.config['monitoring_scope']
-        )
+        # Add changes to state buffer (context keeps repeats)
+        self.state_buffer.add_changes(changes)
         
-        if not changes:
-            logger.debug("No state changes detected")
+        # Only send transitions Claude hasn't seen recently
+        novel_changes = self.deduper.filter(changes)
+        if not novel_changes:
+            logger.debug(f"All {len(changes)} changes were analyzed recently, skipping analysis")
             self.last_check = cycle_start
             return
-        
-        # Add changes to state buffer
-        self.state_buffer.add_changes(changes)
+        changes = novel_changes
         
         # Analyze changes with Claude
         analysis = await self.claude_analyzer.analyze_changes(
@@ -76,11 +182,14 @@ class WatchdogMonitor:
             monitoring_scope=self.config['monitoring_scope']
         )
         
-        # Track API cost
-        self.cost_tracker.record_request(analysis.get('cost_info', {}))
+        # A cached analysis didn't hit the API, and its insight was already stored
+        # and notified when it was first produced
+        cached = analysis.get('cached', False)
+        if not cached:
+            self.cost_tracker.record_request(analysis.get('cost_info', {}))
         
         # Process any insights or alerts
-        if analysis.get('requires_attention', False):
+        if analysis.get('requires_attention', False) and not cached:
             await self.insight_manager.process_insight(analysis)
         
         # Update learning patterns if enabled
@@ -88,7 +197,7 @@ class WatchdogMonitor:
             await self._update_patterns(changes, analysis)
         
         self.last_check = cycle_start
-        logger.debug(f"Monitoring cycle completed in {datetime.now() - cycle_start}")
+        logger.debug(f"Processed {len(changes)} changes in {datetime.now(timezone.utc) - cycle_start}")
     
     async def _establish_baseline(self):
         """Establish baseline state for monitoring"""
@@ -101,7 +210,7 @@ class WatchdogMonitor:
             )
             
             self.state_buffer.set_baseline(current_state)
-            self.last_check = datetime.now()
+            self.last_check = datetime.now(timezone.utc)
             
             logger.info(f"Baseline established with {len(current_state)} entities")
             
@@ -115,21 +224,87 @@ class WatchdogMonitor:
         # This would update stored patterns based on observed behavior
         pass
 
+class ChangeDeduper:
+    """Remember recently analyzed (entity_id, old_state, new_state) transitions
+    
+    Keys live in two generations that rotate every `window` seconds, so a key
+    is forgotten between one and two windows after it was last analyzed.
+    Changes in DEDUPE_EXEMPT_DOMAINS always pass.
+    """
+    
+    def __init__(self, window: float = 600):
+        self.window = window
+        self.current = set()
+        self.previous = set()
+        self.rotated_at = time.monotonic()
+    
+    def filter(self, changes: List[Dict]) -> List[Dict]:
+        """Return the changes not seen within the window, and remember them"""
+        now = time.monotonic()
+        if now - self.rotated_at >= self.window:
+            # Skip a generation entirely if we've been idle for two windows
+            self.previous = self.current if now - self.rotated_at < 2 * self.window else set()
+            self.current = set()
+            self.rotated_at = now
+        
+        novel = []
+        for change in changes:
+            if change.get('domain') in DEDUPE_EXEMPT_DOMAINS:
+                novel.append(change)
+                continue
+            key = (change.get('entity_id'), change.get('old_state'), change.get('new_state'))
+            if key in self.current or key in self.previous:
+                continue
+            self.current.add(key)
+            novel.append(change)
+        return novel
+
+def _parse_ts(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of an HA ISO timestamp ('Z' or offset suffix), or None if unparseable"""
+    try:
+        # Only a trailing 'Z' needs rewriting; HA normally sends '+00:00' already
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        dt = datetime.fromisoformat(value)
+    except (AttributeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
 class StateBuffer:
     """Buffer to store recent state changes for context"""
     
     def __init__(self, max_size: int = 1000):
         self.max_size = max_size
+        # Changes ordered by last_changed; the oldest are dropped once max_size is reached
         self.changes = []
+        # Parsed last_changed of each buffered change, kept ascending
+        self.timestamps = []
         self.baseline = {}
     
     def add_changes(self, changes: List[Dict]):
         """Add new state changes to buffer"""
-        self.changes.extend(changes)
+        timestamps = self.timestamps
+        for change in changes:
+            ts = _parse_ts(change.get('last_changed'))
+            if ts is None:
+                # Can't be placed in a time window
+                logger.debug(f"Skipping change with unparseable timestamp for {change.get('entity_id')}")
+                continue
+            if not timestamps or ts >= timestamps[-1]:
+                timestamps.append(ts)
+                self.changes.append(change)
+            else:
+                # Late arrivals (e.g. reconnect backfill) keep their own time
+                idx = bisect.bisect_right(timestamps, ts)
+                timestamps.insert(idx, ts)
+                self.changes.insert(idx, change)
         
-        # Trim buffer if it exceeds max size
-        if len(self.changes) > self.max_size:
-            self.changes = self.changes[-self.max_size:]
+        excess = len(timestamps) - self.max_size
+        if excess > 0:
+            del timestamps[:excess]
+            del self.changes[:excess]
     
     def set_baseline(self, state: Dict):
         """Set baseline state"""
@@ -137,12 +312,9 @@ class StateBuffer:
     
     def get_context(self, lookback_minutes: int = 60) -> Dict:
         """Get recent context for analysis"""
-        cutoff = datetime.now() - timedelta(minutes=lookback_minutes)
-        
-        recent_changes = [
-            change for change in self.changes
-            if datetime.fromisoformat(change.get('last_changed', '')) > cutoff
-        ]
+        cutoff = time.time() - lookback_minutes * 60
+        # Timestamps were parsed on insert and ascend
+        recent_changes = self.changes[bisect.bisect_right(self.timestamps, cutoff):]
         
         return {
             'baseline': self.baseline,
@@ -39,6 +39,8 @@ init_environment() {
     local log_api_payloads_to_stdout=$(bashio::config 'log_api_payloads_to_stdout' 'false')
     local notify_on_any_insight=$(bashio::config 'notify_on_any_insight' 'false')
     local send_test_notification_on_start=$(bashio::config 'send_test_notification_on_start' 'true')
+    local enable_batch_api=$(bashio::config 'enable_batch_api' 'false')
+    local max_inflight_analyses=$(bashio::config 'max_inflight_analyses' '1')
     
     # Export configuration as environment variables
     export OPENAI_API_KEY="$openai_api_key"
@@ -94,6 +96,8 @@ init_environment() {
     export WATCHDOG_ENABLE_LEARNING="$enable_learning"
     export WATCHDOG_LOG_API_STDOUT="$log_api_payloads_to_stdout"
     export WATCHDOG_NOTIFY_ON_ANY_INSIGHT="$notify_on_any_insight"
+    export WATCHDOG_ENABLE_BATCH_API="$enable_batch_api"
+    export WATCHDOG_MAX_INFLIGHT="$max_inflight_analyses"
     export WATCHDOG_SEND_TEST_NOTIFICATION="$send_test_notification_on_start"
     export WATCHDOG_HTTP_PORT="8099"
     
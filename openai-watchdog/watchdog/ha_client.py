@@ -5,33 +5,115 @@ Home Assistant API client for state monitoring
 import aiohttp
 import asyncio
 import logging
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
+try:
+    import orjson
+except ImportError:
+    import json
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+def _dumps(obj: Any) -> bytes:
+    """Encode a request body as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+# How long the scoped entity list is reused before /api/states is re-read
+SCOPE_ENTITY_TTL = 60.0
+
+# Scope -> domains considered when extracting history changes ('*' = all)
+_SCOPE_DOMAINS = {
+    'climate': frozenset({'climate', 'weather', 'sensor'}),
+    'security': frozenset({'binary_sensor', 'alarm_control_panel', 'lock', 'camera'}),
+    'energy': frozenset({'sensor', 'switch', 'light'}),
+    'automation_performance': frozenset({'automation', 'script'}),
+    'device_health': frozenset({'sensor', 'binary_sensor'}),
+    'patterns': frozenset({'*'})  # All entities for pattern analysis
+}
+
+# Inverted table: domain -> scopes that include it
+_DOMAIN_TO_SCOPES = {
+    domain: frozenset(scope for scope, domains in _SCOPE_DOMAINS.items() if domain in domains)
+    for domain in frozenset().union(*_SCOPE_DOMAINS.values()) - {'*'}
+}
+
+def _scope_matches_everything(scope) -> bool:
+    """True when the scope admits every entity, so filtering can be skipped"""
+    return not scope or 'patterns' in scope or 'all' in scope
+
+@lru_cache(maxsize=16384)
+def _entity_in_scope_cached(entity_id: str, scope_key: tuple) -> bool:
+    """Scope membership for an entity; scope_key is tuple(sorted(scope))"""
+    if _scope_matches_everything(scope_key):
+        return True
+    domain, _, _ = entity_id.partition('.')
+    return not _DOMAIN_TO_SCOPES.get(domain, frozenset()).isdisjoint(scope_key)
+
+@dataclass(slots=True, frozen=True)
+class StateChange:
+    """One entity state transition extracted from history"""
+    entity_id: str
+    domain: str
+    old_state: Any
+    new_state: Any
+    last_changed: Optional[str]
+
 class HomeAssistantClient:
     """Client for interacting with Home Assistant API"""
     
-    def __init__(self, url: str, token: str):
+    # Scope -> (allowed domains, entity_id keyword pattern or None for any)
+    SCOPE_FILTERS = {
+        'climate': (frozenset({'climate', 'weather', 'sensor'}), re.compile(r'temperature|humidity|climate|thermostat')),
+        'security': (frozenset({'binary_sensor', 'alarm_control_panel', 'lock', 'camera'}), re.compile(r'door|window|motion|alarm|lock|security')),
+        'energy': (frozenset({'sensor', 'switch', 'light'}), re.compile(r'power|energy|consumption|watt')),
+        'automation_performance': (frozenset({'automation', 'script'}), None),
+        'device_health': (frozenset({'sensor', 'binary_sensor'}), None)
+    }
+    
+    def __init__(self, url: str, token: str, session: Optional[aiohttp.ClientSession] = None):
         self.url = url.rstrip('/')
         self.token = token
-        self.session = None
+        # A session handed in by the service is shared with other components and closed by it
+        self.session = session
+        self._owns_session = session is None
+        # Bound concurrent history chunk requests to respect HA's connection limits
+        self._history_semaphore = asyncio.Semaphore(8)
+        self._scope_entity_cache = None  # (expires_at, scope_key, entity_ids)
         self.headers = {
             'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json'
         }
     
     async def _get_session(self):
-        """Get or create HTTP session"""
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+        """Get the shared HTTP session, or create one owned by this client"""
+        if self.session is None or self.session.closed:
+            # One HA host: keep connections warm across polls and skip repeat DNS lookups
+            connector = aiohttp.TCPConnector(limit=16, limit_per_host=16, ttl_dns_cache=300, keepalive_timeout=75)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30, connect=5)
+            )
+            self._owns_session = True
         return self.session
     
+    async def _read_json(self, response) -> Any:
+        """Decode a JSON response body, using orjson's C parser when available"""
+        if orjson is not None:
+            return orjson.loads(await response.read())
+        return await response.json()
+    
     async def close(self):
-        """Close HTTP session"""
-        if self.session:
+        """Close HTTP session unless it is shared"""
+        if self.session and self._owns_session:
             await self.session.close()
+            self.session = None
     
     async def get_current_state(self, scope: List[str] = None) -> Dict[str, Any]:
         """Get current state of all entities or filtered by scope"""
@@ -39,10 +121,10 @@ class HomeAssistantClient:
             session = await self._get_session()
             async with session.get(f'{self.url}/api/states', headers=self.headers) as response:
                 if response.status == 200:
-                    entities = await response.json()
+                    entities = await self._read_json(response)
                     
-                    # Filter by monitoring scope if provided
-                    if scope:
+                    # Filter by monitoring scope unless it admits everything
+                    if not _scope_matches_everything(scope):
                         filtered = self._filter_entities_by_scope(entities, scope)
                         return {entity['entity_id']: entity for entity in filtered}
                     
@@ -55,7 +137,22 @@ class HomeAssistantClient:
             logger.error(f"Error getting current state: {e}")
             return {}
     
-    async def get_recent_changes(self, since: Optional[datetime] = None, scope: List[str] = None) -> List[Dict]:
+    async def _scoped_entity_ids(self, scope: List[str] = None) -> List[str]:
+        """Entity ids in the monitoring scope, cached for SCOPE_ENTITY_TTL seconds"""
+        scope_key = tuple(sorted(scope)) if scope else ()
+        now = time.monotonic()
+        cached = self._scope_entity_cache
+        if cached and cached[0] > now and cached[1] == scope_key:
+            return cached[2]
+        
+        states = await self.get_current_state(scope)
+        entity_ids = list(states.keys())
+        # Don't pin an empty list (e.g. HA briefly unavailable) for a full TTL
+        if entity_ids:
+            self._scope_entity_cache = (now + SCOPE_ENTITY_TTL, scope_key, entity_ids)
+        return entity_ids
+    
+    async def get_recent_changes(self, since: Optional[datetime] = None, scope: List[str] = None) -> List[StateChange]:
         """Get recent state changes from history"""
         if since is None:
             from datetime import timezone
@@ -68,40 +165,52 @@ class HomeAssistantClient:
             since_iso = since.astimezone(timezone.utc).replace(microsecond=0).isoformat()
             now_iso = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
-            # Determine scoped entities
-            states = await self.get_current_state(scope)
-            entity_ids = list(states.keys())
+            # Determine scoped entities (entity set changes rarely; reuse between polls)
+            entity_ids = await self._scoped_entity_ids(scope)
             if not entity_ids:
                 return []
 
             CHUNK_SIZE = 150
-            aggregated_history: List[List[Dict]] = []
-            for i in range(0, len(entity_ids), CHUNK_SIZE):
-                chunk = entity_ids[i:i+CHUNK_SIZE]
+
+            async def _fetch_chunk(chunk: List[str]) -> List[List[Dict]]:
                 chunk_params = {
                     'start_time': since_iso,
                     'end_time': now_iso,
                     'minimal_response': '1',
+                    'no_attributes': '1',
                     'filter_entity_id': ','.join(chunk)
                 }
-                async with session.get(
-                    f'{self.url}/api/history/period',
-                    headers=self.headers,
-                    params=chunk_params
-                ) as chunk_resp:
-                    if chunk_resp.status == 200:
-                        chunk_hist = await chunk_resp.json()
-                        aggregated_history.extend(chunk_hist)
-                    else:
+                async with self._history_semaphore:
+                    async with session.get(
+                        f'{self.url}/api/history/period',
+                        params=chunk_params,
+                        headers=self.headers
+                    ) as chunk_resp:
+                        if chunk_resp.status == 200:
+                            return await self._read_json(chunk_resp)
                         chunk_txt = await chunk_resp.text()
                         logger.warning(
                             f"History chunk failed: {chunk_resp.status} for {len(chunk)} entities; {chunk_txt[:120]}"
                         )
+                        return []
+
+            # Fetch all chunks concurrently; a failed chunk doesn't sink the others
+            results = await asyncio.gather(
+                *[_fetch_chunk(entity_ids[i:i+CHUNK_SIZE]) for i in range(0, len(entity_ids), CHUNK_SIZE)],
+                return_exceptions=True
+            )
+            aggregated_history: List[List[Dict]] = []
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning(f"History chunk error: {result}")
+                    continue
+                aggregated_history.extend(result)
 
             if not aggregated_history:
                 return []
 
-            changes = self._extract_changes_from_history(aggregated_history, scope)
+            # History was already filtered to scoped entities server-side
+            changes = self._extract_changes_from_history(aggregated_history)
             logger.debug(
                 f"History query: {len(changes)} changes from {len(entity_ids)} entities in {((len(entity_ids)-1)//CHUNK_SIZE)+1} calls"
             )
@@ -110,45 +219,55 @@ class HomeAssistantClient:
             logger.error(f"Error getting recent changes: {e}")
             return []
     
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _domain_filters(scope_key: tuple) -> Dict[str, Optional[re.Pattern]]:
+        """Domain -> combined keyword pattern for the given scopes (None matches any id)"""
+        keywords: Dict[str, List[str]] = {}
+        match_any = set()
+        for scope_item in scope_key:
+            if scope_item not in HomeAssistantClient.SCOPE_FILTERS:
+                continue
+            domains, pattern = HomeAssistantClient.SCOPE_FILTERS[scope_item]
+            for domain in domains:
+                if pattern is None:
+                    match_any.add(domain)
+                else:
+                    keywords.setdefault(domain, []).append(pattern.pattern)
+        
+        filters: Dict[str, Optional[re.Pattern]] = {domain: None for domain in match_any}
+        for domain, patterns in keywords.items():
+            if domain not in match_any:
+                filters[domain] = re.compile('|'.join(patterns))
+        return filters
+    
     def _filter_entities_by_scope(self, entities: List[Dict], scope: List[str]) -> List[Dict]:
         """Filter entities based on monitoring scope"""
-        if not scope:
+        # Empty scope, 'all', or pattern analysis include every entity
+        if _scope_matches_everything(scope):
             return entities
         
-        # If patterns analysis is requested, include all entities
-        if 'patterns' in scope:
-            return entities
+        domain_filters = self._domain_filters(tuple(sorted(scope)))
         
         filtered = []
         for entity in entities:
             entity_id = entity.get('entity_id', '')
-            domain = entity_id.split('.')[0] if '.' in entity_id else ''
+            domain, _, _ = entity_id.partition('.')
             
-            # Map scope to domains
-            if 'climate' in scope and domain in ['climate', 'weather', 'sensor']:
-                if any(keyword in entity_id.lower() for keyword in ['temperature', 'humidity', 'climate', 'thermostat']):
-                    filtered.append(entity)
-            
-            if 'security' in scope and domain in ['binary_sensor', 'alarm_control_panel', 'lock', 'camera']:
-                if any(keyword in entity_id.lower() for keyword in ['door', 'window', 'motion', 'alarm', 'lock', 'security']):
-                    filtered.append(entity)
-            
-            if 'energy' in scope and domain in ['sensor', 'switch', 'light']:
-                if any(keyword in entity_id.lower() for keyword in ['power', 'energy', 'consumption', 'watt']):
-                    filtered.append(entity)
-            
-            if 'automation_performance' in scope and domain in ['automation', 'script']:
-                filtered.append(entity)
-            
-            if 'device_health' in scope and domain in ['sensor', 'binary_sensor']:
+            # Domains no requested scope covers are skipped without a keyword scan
+            if domain not in domain_filters:
+                continue
+            pattern = domain_filters[domain]
+            if pattern is None or pattern.search(entity_id.lower()):
                 filtered.append(entity)
         
         # If filtering produced no entities, fall back to all to avoid empty baseline
         return filtered if filtered else entities
     
-    def _extract_changes_from_history(self, history: List[List[Dict]], scope: List[str] = None) -> List[Dict]:
+    def _extract_changes_from_history(self, history: List[List[Dict]], scope: List[str] = None) -> List[StateChange]:
         """Extract meaningful changes from history data"""
         changes = []
+        scope_key = tuple(sorted(scope)) if scope else None
         
         for entity_history in history:
             if not entity_history:
@@ -157,8 +276,9 @@ class HomeAssistantClient:
             entity_id = entity_history[0].get('entity_id', '')
             
             # Skip if not in monitoring scope
-            if scope and not self._entity_in_scope(entity_id, scope):
+            if scope_key and not _entity_in_scope_cached(entity_id, scope_key):
                 continue
+            domain = entity_id.split('.')[0] if '.' in entity_id else ''
             
             # Look for state changes
             for i in range(1, len(entity_history)):
@@ -166,36 +286,19 @@ class HomeAssistantClient:
                 curr_state = entity_history[i]
                 
                 if prev_state.get('state') != curr_state.get('state'):
-                    changes.append({
-                        'entity_id': entity_id,
-                        'old_state': prev_state.get('state'),
-                        'new_state': curr_state.get('state'),
-                        'last_changed': curr_state.get('last_changed'),
-                        'attributes': curr_state.get('attributes', {}),
-                        'domain': entity_id.split('.')[0] if '.' in entity_id else ''
-                    })
+                    changes.append(StateChange(
+                        entity_id=entity_id,
+                        domain=domain,
+                        old_state=prev_state.get('state'),
+                        new_state=curr_state.get('state'),
+                        last_changed=curr_state.get('last_changed')
+                    ))
         
         return changes
     
     def _entity_in_scope(self, entity_id: str, scope: List[str]) -> bool:
         """Check if entity is in monitoring scope"""
-        domain = entity_id.split('.')[0] if '.' in entity_id else ''
-        
-        scope_domains = {
-            'climate': ['climate', 'weather', 'sensor'],
-            'security': ['binary_sensor', 'alarm_control_panel', 'lock', 'camera'],
-            'energy': ['sensor', 'switch', 'light'],
-            'automation_performance': ['automation', 'script'],
-            'device_health': ['sensor', 'binary_sensor'],
-            'patterns': ['*']  # All entities for pattern analysis
-        }
-        
-        for scope_item in scope:
-            if scope_item in scope_domains:
-                if '*' in scope_domains[scope_item] or domain in scope_domains[scope_item]:
-                    return True
-        
-        return False
+        return _entity_in_scope_cached(entity_id, tuple(sorted(scope)))
     
     async def send_notification(self, service: str, message: str, title: str = "OpenAI Watchdog", **kwargs):
         """Send notification through Home Assistant"""
@@ -236,8 +339,8 @@ class HomeAssistantClient:
 
             async with session.post(
                 endpoint,
-                headers=self.headers,
-                json=payload
+                data=_dumps(payload),
+                headers=self.headers
             ) as response:
                 if response.status == 200:
                     logger.info(f"Notification sent via {service}")
@@ -2,14 +2,51 @@
 Insight management and notification system
 """
 
+import asyncio
+import bisect
 import json
 import logging
+import threading
+import time
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import os
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Insights older than this are dropped from memory (and from the log on compaction)
+RETENTION_DAYS = 30
+
+# Rewrite the insight log once it holds this many records beyond the live set
+COMPACT_MIN_RECORDS = 500
+
+def _classify_text(insight_text: str) -> str:
+    """Map lowercased insight text to an insight type"""
+    if any(word in insight_text for word in ['security', 'door', 'lock', 'alarm', 'motion']):
+        return 'security'
+    elif any(word in insight_text for word in ['energy', 'power', 'consumption', 'efficiency']):
+        return 'energy'
+    elif any(word in insight_text for word in ['temperature', 'climate', 'hvac', 'heating', 'cooling']):
+        return 'climate'
+    elif any(word in insight_text for word in ['automation', 'script', 'performance', 'failed']):
+        return 'automation'
+    elif any(word in insight_text for word in ['device', 'battery', 'connectivity', 'health']):
+        return 'device_health'
+    else:
+        return 'general'
+
+def _ts_key(insight: Dict[str, Any]) -> float:
+    return insight.get('_ts', 0)
+
+def _public(insight: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of an insight without the in-memory '_ts' field"""
+    return {k: v for k, v in insight.items() if k != '_ts'}
+
 class InsightManager:
     """Manage insights, alerts, and notifications"""
     
@@ -17,49 +54,160 @@ class InsightManager:
         self.data_dir = data_dir
         self.ha_client = ha_client
         self.notification_service = notification_service
-        self.insights_file = os.path.join(data_dir, 'insights', 'insights.json')
+        self.insights_file = os.path.join(data_dir, 'insights', 'insights.jsonl')
+        # Pre-JSONL snapshot, read once if no log exists yet
+        self.legacy_insights_file = os.path.join(data_dir, 'insights', 'insights.json')
+        self._log_records = 0
+        # Appends run in a worker thread; serialize them with compaction
+        self._log_lock = threading.Lock()
+        self._compacting = False
         
         # Ensure insights directory exists
         os.makedirs(os.path.dirname(self.insights_file), exist_ok=True)
         
-        # Load existing insights
+        # Load existing insights (kept ordered by '_ts' so time windows can bisect)
         self.insights = self._load_insights()
+        # Aggregates for get_insight_statistics, maintained on insert and eviction
+        self._by_type = Counter()
+        self._attention = 0
+        self._conf_sum = 0.0
+        self._conf_n = 0
+        for insight in self.insights:
+            self._count_insight(insight, 1)
+        # Set and then replaced on every new insight, so each waiter wakes once per arrival
+        self.new_insight = asyncio.Event()
     
     def _load_insights(self) -> List[Dict[str, Any]]:
-        """Load existing insights from file"""
+        """Load existing insights from the append-only log"""
         try:
-            if os.path.exists(self.insights_file):
-                with open(self.insights_file, 'r') as f:
-                    data = json.load(f)
-                    
-                # Clean old insights (keep last 30 days)
-                cutoff = datetime.now() - timedelta(days=30)
-                recent_insights = [
-                    insight for insight in data.get('insights', [])
-                    if datetime.fromisoformat(insight.get('timestamp', '')) > cutoff
-                ]
-                return recent_insights
+            if not os.path.exists(self.insights_file):
+                return self._load_legacy_insights()
+            
+            # Later records for the same insight (e.g. acknowledgements) replace
+            # earlier ones; ids are per-second, so the timestamp disambiguates
+            by_key = {}
+            records = 0
+            torn = False
+            loads = orjson.loads if orjson is not None else json.loads
+            with open(self.insights_file, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        insight = loads(line)
+                    except ValueError:
+                        # Torn final write after a crash; skip the partial line
+                        torn = True
+                        continue
+                    by_key[(insight.get('id'), insight.get('timestamp'))] = insight
+                    records += 1
+            self._log_records = records
+            
+            recent_insights = self._recent_only(by_key.values())
+            if torn:
+                # Rewrite so the next append doesn't land on the partial line
+                self.insights = recent_insights
+                self._compact()
+            return recent_insights
         except Exception as e:
             logger.error(f"Error loading insights: {e}")
         
         return []
     
-    def _save_insights(self):
-        """Save insights to file"""
+    def _load_legacy_insights(self) -> List[Dict[str, Any]]:
+        """Migrate insights from the old single-document insights.json"""
+        if not os.path.exists(self.legacy_insights_file):
+            return []
+        with open(self.legacy_insights_file, 'r') as f:
+            data = json.load(f)
+        
+        recent_insights = self._recent_only(data.get('insights', []))
+        self.insights = recent_insights
+        self._compact()
+        return recent_insights
+    
+    def _recent_only(self, insights) -> List[Dict[str, Any]]:
+        """Stamp each insight with its epoch '_ts' and keep the retention window, oldest first"""
+        cutoff_ts = (datetime.now() - timedelta(days=RETENTION_DAYS)).timestamp()
+        recent_insights = []
+        for insight in insights:
+            insight['_ts'] = datetime.fromisoformat(insight.get('timestamp', '')).timestamp()
+            if insight['_ts'] > cutoff_ts:
+                recent_insights.append(insight)
+        recent_insights.sort(key=_ts_key)
+        return recent_insights
+    
+    @staticmethod
+    def _serialize(insight: Dict[str, Any]) -> bytes:
+        """One compact JSON line, without the in-memory '_ts' field"""
+        record = _public(insight)
+        if orjson is not None:
+            return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+        return (json.dumps(record, separators=(',', ':')) + '\n').encode()
+    
+    def _write_record(self, record: bytes):
+        """Append one serialized record to the log and fsync it"""
+        with self._log_lock:
+            with open(self.insights_file, 'ab') as f:
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_records += 1
+    
+    async def _append_insight_async(self, insight: Dict[str, Any]):
+        """Append one insight record without blocking the event loop on fsync"""
+        try:
+            # Serialize here so the worker thread never reads live insight dicts
+            await asyncio.to_thread(self._write_record, self._serialize(insight))
+            if self._needs_compact() and not self._compacting:
+                self._compacting = True
+                try:
+                    # Snapshot on the loop; the rewrite and fsync run in a worker thread
+                    records = [self._serialize(i) for i in self.insights]
+                    await asyncio.to_thread(self._rewrite_log, records, self._log_records)
+                finally:
+                    self._compacting = False
+        except Exception as e:
+            logger.error(f"Error saving insight: {e}")
+    
+    def _needs_compact(self) -> bool:
+        return self._log_records > len(self.insights) + COMPACT_MIN_RECORDS
+    
+    def _compact(self):
+        """Rewrite the log with only the live insights"""
+        self._rewrite_log([self._serialize(i) for i in self.insights])
+    
+    def _rewrite_log(self, records: List[bytes], expected_records: Optional[int] = None):
+        """Replace the log with the given serialized records
+        
+        With expected_records, the rewrite is skipped if other records were
+        appended after the snapshot was taken; the next append retries it.
+        """
         try:
             os.makedirs(os.path.dirname(self.insights_file), exist_ok=True)
-            with open(self.insights_file, 'w') as f:
-                json.dump({'insights': self.insights}, f, indent=2)
+            tmp_file = self.insights_file + '.tmp'
+            with self._log_lock:
+                if expected_records is not None and self._log_records != expected_records:
+                    return
+                with open(tmp_file, 'wb') as f:
+                    f.writelines(records)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.insights_file)
+                self._log_records = len(records)
         except Exception as e:
-            logger.error(f"Error saving insights: {e}")
+            logger.error(f"Error compacting insights: {e}")
     
     async def process_insight(self, analysis: Dict[str, Any]):
         """Process and handle a new insight from analysis"""
         try:
             # Create insight record
+            now = datetime.now()
             insight = {
-                'id': f"insight_{int(datetime.now().timestamp())}",
-                'timestamp': datetime.now().isoformat(),
+                'id': f"insight_{int(now.timestamp())}",
+                'timestamp': now.isoformat(),
+                '_ts': now.timestamp(),
                 'type': self._classify_insight_type(analysis),
                 'confidence': analysis.get('confidence', 0.0),
                 'summary': self._generate_summary(analysis),
@@ -70,11 +218,15 @@ class InsightManager:
                 'provider': analysis.get('provider', analysis.get('cost_info', {}).get('provider', 'unknown'))
             }
             
-            # Add to insights list
-            self.insights.append(insight)
+            # Add to insights list (normally lands at the end) and drop expired ones
+            bisect.insort(self.insights, insight, key=_ts_key)
+            self._count_insight(insight, 1)
+            self._evict_expired()
+            self.new_insight.set()
+            self.new_insight = asyncio.Event()
             
-            # Save insights
-            self._save_insights()
+            # Persist the new record
+            await self._append_insight_async(insight)
             
             # Send notification if required
             if insight['requires_attention']:
@@ -104,18 +256,7 @@ class InsightManager:
 
         insight_text = _flatten_text(insights)
         
-        if any(word in insight_text for word in ['security', 'door', 'lock', 'alarm', 'motion']):
-            return 'security'
-        elif any(word in insight_text for word in ['energy', 'power', 'consumption', 'efficiency']):
-            return 'energy'
-        elif any(word in insight_text for word in ['temperature', 'climate', 'hvac', 'heating', 'cooling']):
-            return 'climate'
-        elif any(word in insight_text for word in ['automation', 'script', 'performance', 'failed']):
-            return 'automation'
-        elif any(word in insight_text for word in ['device', 'battery', 'connectivity', 'health']):
-            return 'device_health'
-        else:
-            return 'general'
+        return _classify_text(insight_text)
     
     def _generate_summary(self, analysis: Dict[str, Any]) -> str:
         """Generate a concise summary of the insight"""
@@ -164,19 +305,47 @@ class InsightManager:
         except Exception as e:
             logger.error(f"Error sending notification: {e}")
     
+    def _evict_expired(self):
+        """Drop insights that have aged out of the retention window"""
+        cutoff_ts = (datetime.now() - timedelta(days=RETENTION_DAYS)).timestamp()
+        idx = bisect.bisect_right(self.insights, cutoff_ts, key=_ts_key)
+        if not idx:
+            return
+        for insight in self.insights[:idx]:
+            self._count_insight(insight, -1)
+        del self.insights[:idx]
+    
+    def _count_insight(self, insight: Dict[str, Any], sign: int):
+        """Add (sign=1) or remove (sign=-1) an insight from the running aggregates"""
+        insight_type = insight.get('type', 'unknown')
+        self._by_type[insight_type] += sign
+        if self._by_type[insight_type] <= 0:
+            del self._by_type[insight_type]
+        if insight.get('requires_attention', False):
+            self._attention += sign
+        confidence = insight.get('confidence', 0.0)
+        if confidence > 0:
+            self._conf_sum += sign * confidence
+            self._conf_n += sign
+    
+    def _count_since(self, cutoff_ts: float) -> int:
+        """Number of insights newer than cutoff_ts"""
+        return len(self.insights) - bisect.bisect_right(self.insights, cutoff_ts, key=_ts_key)
+    
     def get_recent_insights(self, hours: int = 24, insight_type: str = None) -> List[Dict[str, Any]]:
         """Get recent insights, optionally filtered by type"""
-        cutoff = datetime.now() - timedelta(hours=hours)
+        cutoff_ts = time.time() - hours * 3600
         
-        recent = [
-            insight for insight in self.insights
-            if datetime.fromisoformat(insight.get('timestamp', '')) > cutoff
+        # Insights are kept sorted by '_ts': bisect to the window, then copy it newest first
+        idx = bisect.bisect_right(self.insights, cutoff_ts, key=_ts_key)
+        return [
+            _public(insight) for insight in reversed(self.insights[idx:])
+            if not insight_type or insight.get('type') == insight_type
         ]
-        
-        if insight_type:
-            recent = [insight for insight in recent if insight.get('type') == insight_type]
-        
-        return sorted(recent, key=lambda x: x.get('timestamp', ''), reverse=True)
+    
+    def latest_insight(self) -> Optional[Dict[str, Any]]:
+        """The newest insight, or None if there are none"""
+        return _public(self.insights[-1]) if self.insights else None
     
     def get_insight_statistics(self) -> Dict[str, Any]:
         """Get statistics about insights"""
@@ -188,40 +357,25 @@ class InsightManager:
                 'average_confidence': 0.0
             }
         
-        # Calculate statistics
-        total = len(self.insights)
-        attention_required = len([i for i in self.insights if i.get('requires_attention', False)])
-        
-        # Group by type
-        by_type = {}
-        confidences = []
-        
-        for insight in self.insights:
-            insight_type = insight.get('type', 'unknown')
-            by_type[insight_type] = by_type.get(insight_type, 0) + 1
-            
-            confidence = insight.get('confidence', 0.0)
-            if confidence > 0:
-                confidences.append(confidence)
-        
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        avg_confidence = self._conf_sum / self._conf_n if self._conf_n else 0.0
+        now_ts = datetime.now().timestamp()
         
         return {
-            'total_insights': total,
-            'attention_required': attention_required,
-            'by_type': by_type,
+            'total_insights': len(self.insights),
+            'attention_required': self._attention,
+            'by_type': dict(self._by_type),
             'average_confidence': avg_confidence,
-            'recent_24h': len(self.get_recent_insights(24)),
-            'recent_7d': len(self.get_recent_insights(24 * 7))
+            'recent_24h': self._count_since(now_ts - 24 * 3600),
+            'recent_7d': self._count_since(now_ts - 7 * 24 * 3600)
         }
     
-    def mark_insight_acknowledged(self, insight_id: str):
+    async def mark_insight_acknowledged(self, insight_id: str):
         """Mark an insight as acknowledged"""
         for insight in self.insights:
             if insight.get('id') == insight_id:
                 insight['status'] = 'acknowledged'
                 insight['acknowledged_at'] = datetime.now().isoformat()
-                self._save_insights()
+                await self._append_insight_async(insight)
                 logger.info(f"Insight {insight_id} marked as acknowledged")
                 return True
         
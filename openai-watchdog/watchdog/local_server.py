@@ -9,7 +9,7 @@ check utility; process management can be added later.
 import asyncio
 import logging
 import os
-from typing import Optional
+from typing import Any, Optional
 
 import aiohttp
 
@@ -17,17 +17,49 @@ logger = logging.getLogger(__name__)
 
 
 class LocalServerManager:
-    def __init__(self, base_url: Optional[str] = None):
+    def __init__(self, base_url: Optional[str] = None, session: Optional[aiohttp.ClientSession] = None):
         self.base_url = base_url or os.getenv('WATCHDOG_LOCAL_BASE_URL', '').strip()
+        # A session handed in by the service is shared with other components and closed by it
+        self._session = session
+        self._owns_session = session is None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, or create a pooled one owned by this manager"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4, ttl_dns_cache=300, keepalive_timeout=30)
+            )
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        """Close HTTP session unless it is shared"""
+        if self._session and self._owns_session:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
 
     async def is_healthy(self) -> bool:
         url = (self.base_url or '').rstrip('/') + '/v1/models'
         if not self.base_url:
             return False
         try:
-            timeout = aiohttp.ClientTimeout(total=1.5)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url) as resp:
-                    return resp.status == 200
+            session = await self._get_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=1.5)) as resp:
+                return resp.status == 200
         except Exception:
             return False
+
+    async def get_models(self, timeout: float = 2.0) -> Any:
+        """Fetch the OpenAI-compatible /v1/models payload; raises on HTTP errors"""
+        url = (self.base_url or '').rstrip('/') + '/v1/models'
+        session = await self._get_session()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}")
+            return await resp.json()
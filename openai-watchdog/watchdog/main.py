@@ -5,12 +5,19 @@ Main monitoring service that runs continuously
 """
 
 import asyncio
+import json
 import os
 import sys
 import signal
 import logging
+import aiohttp
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from types import MappingProxyType
+from typing import Any, Mapping, Sequence
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 from .watchdog_monitor import WatchdogMonitor
 from .ha_client import HomeAssistantClient
@@ -31,9 +38,63 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Scope used when WATCHDOG_MONITORING_SCOPE is 'all', empty or 'true'
+_MONITORING_SCOPE_DEFAULT = (
+    'climate', 'security', 'energy',
+    'automation_performance', 'device_health', 'patterns'
+)
+
+def _parse_monitoring_scope() -> Sequence[str]:
+    """Parse monitoring scope. Accepts single string like 'all' or a list-json string."""
+    raw = os.getenv('WATCHDOG_MONITORING_SCOPE', 'all').strip().lower()
+    if raw == 'all' or raw == '' or raw == 'true':
+        return _MONITORING_SCOPE_DEFAULT
+    # Try JSON list
+    try:
+        parsed = json.loads(raw)
+        if isinstance(parsed, list):
+            parsed_lower = [str(x).lower() for x in parsed]
+            if 'all' in parsed_lower:
+                return _MONITORING_SCOPE_DEFAULT
+            return parsed_lower
+    except Exception:
+        pass
+    # Try comma-separated list from UI edge cases
+    if ',' in raw:
+        return [x.strip() for x in raw.split(',') if x.strip()]
+    # Otherwise treat as single category
+    return [raw]
+
+def _load_config() -> Mapping[str, Any]:
+    """Load configuration from environment variables"""
+    return MappingProxyType({
+        'model': os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+        'check_interval': int(os.getenv('WATCHDOG_CHECK_INTERVAL', '30')),
+        'insight_threshold': float(os.getenv('WATCHDOG_INSIGHT_THRESHOLD', '0.8')),
+        'max_daily_calls': int(os.getenv('WATCHDOG_MAX_DAILY_CALLS', '1000')),
+        'cost_limit': float(os.getenv('WATCHDOG_COST_LIMIT', '1.00')),
+        'enable_learning': os.getenv('WATCHDOG_ENABLE_LEARNING', 'true').lower() == 'true',
+        'max_inflight': max(1, int(os.getenv('WATCHDOG_MAX_INFLIGHT', '1'))),
+        'notify_on_any_insight': os.getenv('WATCHDOG_NOTIFY_ON_ANY_INSIGHT', 'false').lower() == 'true',
+        'monitoring_scope': _parse_monitoring_scope(),
+        'notification_service': os.getenv('WATCHDOG_NOTIFICATION_SERVICE', 'persistent_notification'),
+        'data_dir': os.getenv('OPENAI_WATCHDOG_DATA', '/config/openai-watchdog'),
+        'ha_url': os.getenv('HA_URL', 'http://supervisor/core'),
+        'ha_token': os.getenv('HASSIO_TOKEN', '')
+    })
+
+# Add-on options are fixed for the life of the process
+_CONFIG = _load_config()
+
 class OpenAIWatchdogService:
     """Main service class for OpenAI Watchdog"""
     
+    __slots__ = (
+        'running', 'monitor', 'ha_client', 'openai_analyzer', 'cost_tracker',
+        'insight_manager', 'web_server', 'provider_policy', 'config', '_stop_event',
+        'http_session'
+    )
+    
     def __init__(self):
         self.running = False
         self.monitor = None
@@ -43,64 +104,29 @@ class OpenAIWatchdogService:
         self.insight_manager = None
         self.web_server = None
         self.provider_policy = None
+        self._stop_event = None
+        self.http_session = None
         
-        # Load configuration from environment
-        self.config = self._load_config()
+        # Configuration is read from the environment once at import; the monitor
+        # records runtime keys (last_provider, ...) so each service gets a copy
+        self.config = dict(_CONFIG)
         
-    def _load_config(self) -> Dict[str, Any]:
-        """Load configuration from environment variables"""
-        return {
-            'model': os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-            'check_interval': int(os.getenv('WATCHDOG_CHECK_INTERVAL', '30')),
-            'insight_threshold': float(os.getenv('WATCHDOG_INSIGHT_THRESHOLD', '0.8')),
-            'max_daily_calls': int(os.getenv('WATCHDOG_MAX_DAILY_CALLS', '1000')),
-            'cost_limit': float(os.getenv('WATCHDOG_COST_LIMIT', '1.00')),
-            'enable_learning': os.getenv('WATCHDOG_ENABLE_LEARNING', 'true').lower() == 'true',
-            'notify_on_any_insight': os.getenv('WATCHDOG_NOTIFY_ON_ANY_INSIGHT', 'false').lower() == 'true',
-            'monitoring_scope': self._parse_monitoring_scope(),
-            'notification_service': os.getenv('WATCHDOG_NOTIFICATION_SERVICE', 'persistent_notification'),
-            'data_dir': os.getenv('OPENAI_WATCHDOG_DATA', '/config/openai-watchdog'),
-            'ha_url': os.getenv('HA_URL', 'http://supervisor/core'),
-            'ha_token': os.getenv('HASSIO_TOKEN', '')
-        }
-    
-    def _parse_monitoring_scope(self) -> List[str]:
-        """Parse monitoring scope. Accepts single string like 'all' or a list-json string."""
-        raw = os.getenv('WATCHDOG_MONITORING_SCOPE', 'all').strip().lower()
-        if raw == 'all' or raw == '' or raw == 'true':
-            return [
-                'climate', 'security', 'energy',
-                'automation_performance', 'device_health', 'patterns'
-            ]
-        # Try JSON list
-        try:
-            import json
-            parsed = json.loads(raw)
-            if isinstance(parsed, list):
-                parsed_lower = [str(x).lower() for x in parsed]
-                if 'all' in parsed_lower:
-                    return [
-                        'climate', 'security', 'energy',
-                        'automation_performance', 'device_health', 'patterns'
-                    ]
-                return parsed_lower
-        except Exception:
-            pass
-        # Try comma-separated list from UI edge cases
-        if ',' in raw:
-            return [x.strip() for x in raw.split(',') if x.strip()]
-        # Otherwise treat as single category
-        return [raw]
-    
     async def initialize(self):
         """Initialize all service components"""
         logger.info("Initializing OpenAI Watchdog components...")
         
         try:
+            # One connection pool for every aiohttp caller (HA API, local server probes)
+            self.http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, limit_per_host=16, ttl_dns_cache=300, keepalive_timeout=75),
+                timeout=aiohttp.ClientTimeout(total=30, connect=5)
+            )
+
             # Initialize Home Assistant client
             self.ha_client = HomeAssistantClient(
                 url=self.config['ha_url'],
-                token=self.config['ha_token']
+                token=self.config['ha_token'],
+                session=self.http_session
             )
             
             # Initialize OpenAI analyzer
@@ -149,7 +175,7 @@ class OpenAIWatchdogService:
 
             # Start lightweight web status server (for ingress)
             try:
-                self.web_server = StatusWebServer(self.config, self.cost_tracker, self.insight_manager)
+                self.web_server = StatusWebServer(self.config, self.cost_tracker, self.insight_manager, session=self.http_session)
                 await self.web_server.start()
                 logger.info("Web status server started for ingress")
             except Exception as e:
@@ -164,22 +190,36 @@ class OpenAIWatchdogService:
     async def start(self):
         """Start the monitoring service"""
         logger.info("Starting OpenAI Watchdog monitoring service...")
-        # Set up signal handlers for graceful shutdown
-        signal.signal(signal.SIGTERM, self._signal_handler)
-        signal.signal(signal.SIGINT, self._signal_handler)
+        # Shutdown signals wake the loop directly and end the monitor right away
+        loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._signal_handler, signum)
         self.running = True
         try:
             await self.initialize()
-            await self.monitor.start_monitoring()
+            monitor_task = asyncio.create_task(self.monitor.start_monitoring())
+            stop_task = asyncio.create_task(self._stop_event.wait())
+            await asyncio.wait({monitor_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+            stop_task.cancel()
+            if monitor_task.done():
+                monitor_task.result()
+            else:
+                monitor_task.cancel()
+                try:
+                    await monitor_task
+                except asyncio.CancelledError:
+                    pass
         except Exception as e:
             logger.error(f"Service error: {e}")
             self.running = False
             raise
 
-    def _signal_handler(self, signum, frame):
+    def _signal_handler(self, signum):
         """Handle shutdown signals"""
         logger.info(f"Received signal {signum}, shutting down gracefully...")
         self.running = False
+        self._stop_event.set()
 
     async def stop(self):
         """Stop the monitoring service"""
@@ -195,6 +235,18 @@ class OpenAIWatchdogService:
                 await self.web_server.stop()
         except Exception:
             pass
+        try:
+            if self.openai_analyzer:
+                await self.openai_analyzer.aclose()
+        except Exception:
+            pass
+        try:
+            if self.ha_client:
+                await self.ha_client.close()
+            if self.http_session:
+                await self.http_session.close()
+        except Exception:
+            pass
 
 # Service entry point
 async def main():
@@ -212,4 +264,10 @@ async def main():
         await service.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # libuv-backed event loop when available: lower per-callback and socket I/O overhead
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        if sys.version_info >= (3, 12):
+            # Tasks that finish without suspending skip a trip through the scheduler
+            runner.get_loop().set_task_factory(asyncio.eager_task_factory)
+        runner.run(main())
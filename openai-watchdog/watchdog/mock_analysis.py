@@ -2,10 +2,20 @@
 Mock analysis utilities for OpenAI Watchdog
 """
 
+import re
 from typing import Dict, List, Any
 
+from .ha_client import StateChange
 
-async def mock_openai_analysis(model: str, changes: List[Dict]) -> Dict[str, Any]:
+# Entity id keywords behind the mock security and energy insights
+_SECURITY_RE = re.compile(r'door|lock')
+_ENERGY_RE = re.compile(r'power|energy')
+# Either kind of keyword; one scan rules out most unrelated entities
+_ANY_KEYWORD_RE = re.compile(f'{_SECURITY_RE.pattern}|{_ENERGY_RE.pattern}')
+# Entity ids listed per mock insight
+MOCK_ENTITY_SAMPLE = 3
+
+async def mock_openai_analysis(model: str, changes: List[StateChange]) -> Dict[str, Any]:
     """Generate a deterministic mock analysis for development/testing.
 
     Args:
@@ -20,29 +30,43 @@ async def mock_openai_analysis(model: str, changes: List[Dict]) -> Dict[str, Any
     requires_attention = False
     confidence = 0.7
 
-    # Heuristic: treat door/lock entities as security-relevant
-    security_changes = [
-        c for c in changes if 'door' in c.get('entity_id', '') or 'lock' in c.get('entity_id', '')
-    ]
-    if security_changes:
+    # Heuristics in one pass: door/lock entities are security-relevant,
+    # power/energy entities are energy-relevant. Only counts and the first
+    # few ids are reported, so only those are kept
+    security_entities: List[str] = []
+    energy_entities: List[str] = []
+    security_count = energy_count = 0
+    has_keyword = _ANY_KEYWORD_RE.search
+    is_security = _SECURITY_RE.search
+    is_energy = _ENERGY_RE.search
+    for c in changes:
+        entity_id = c.entity_id
+        if not has_keyword(entity_id):
+            continue
+        if is_security(entity_id):
+            if security_count < MOCK_ENTITY_SAMPLE:
+                security_entities.append(entity_id)
+            security_count += 1
+        if is_energy(entity_id):
+            if energy_count < MOCK_ENTITY_SAMPLE:
+                energy_entities.append(entity_id)
+            energy_count += 1
+
+    if security_count:
         insights.append({
             'type': 'security',
-            'message': f'Security activity detected: {len(security_changes)} security-related changes',
+            'message': f'Security activity detected: {security_count} security-related changes',
             'confidence': 0.8,
-            'entities': [c.get('entity_id') for c in security_changes[:3]],
+            'entities': security_entities,
         })
         requires_attention = True
 
-    # Heuristic: treat power/energy entities as energy-relevant
-    energy_changes = [
-        c for c in changes if 'power' in c.get('entity_id', '') or 'energy' in c.get('entity_id', '')
-    ]
-    if energy_changes:
+    if energy_count:
         insights.append({
             'type': 'energy',
-            'message': f'Energy monitoring: {len(energy_changes)} power-related changes',
+            'message': f'Energy monitoring: {energy_count} power-related changes',
             'confidence': 0.6,
-            'entities': [c.get('entity_id') for c in energy_changes[:3]],
+            'entities': energy_entities,
         })
 
     # Mock cost info (no cost in mock mode)
@@ -2,16 +2,37 @@
 OpenAI analysis engine for interpreting Home Assistant state changes
 """
 
+import asyncio
 import os
 import json
 import logging
+import random
 import re
-from typing import Dict, List, Any, Optional
+import time
+from functools import lru_cache
+from itertools import islice
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Union
 from datetime import datetime, timedelta
 try:
     from openai import AsyncOpenAI
 except ImportError:
     AsyncOpenAI = None
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    # httpx negotiates HTTP/2 only when the h2 package is installed
+    import h2
+except ImportError:
+    h2 = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from .ha_client import StateChange
+from .rate_limiter import RateLimiter
 try:
     # Local mock utilities
     from .mock_analysis import mock_openai_analysis
@@ -20,46 +41,213 @@ except Exception:
 
 logger = logging.getLogger(__name__)
 
+# Set by Home Assistant from the add-on configuration before the service starts
+API_KEY = os.getenv('OPENAI_API_KEY')
+
+# Rate-limit hint such as 'try again in 3h20m0.959s' or 'in 20ms'; a number must follow 'in'
+_WAIT_RE = re.compile(r"\bin\s+(?=\d)(?:(\d+)h)?(?:(\d+)m(?!s))?(?:(\d+(?:\.\d+)?)(ms|s))?", re.IGNORECASE)
+
 # OpenAI model pricing per 1k tokens (input/output)
 OPENAI_PRICING = {
     'gpt-4o-mini': {'input': 0.00015, 'output': 0.0006},
     'gpt-4o': {'input': 0.0025, 'output': 0.01},
     'gpt-3.5-turbo': {'input': 0.0005, 'output': 0.0015}
 }
+# Batch API requests are billed at this fraction of the synchronous price
+BATCH_PRICE_MULTIPLIER = 0.5
+# Prompt tokens served from the prompt cache are billed at this fraction of the input price
+CACHED_INPUT_MULTIPLIER = 0.5
+# API log entries are written in batches of up to this many, at least once per LOG_FLUSH_INTERVAL seconds
+LOG_FLUSH_BATCH = 32
+LOG_FLUSH_INTERVAL = 1.0
+# Entries waiting for the API log writer beyond this many are dropped
+LOG_QUEUE_SIZE = 1024
+# Seconds between attempts to reopen an API log that could not be opened, doubling up to the max
+LOG_REOPEN_BACKOFF = 1.0
+LOG_REOPEN_BACKOFF_MAX = 60.0
+
+# Connections the shared HTTP client may open to the API (keep-alive is capped at 16)
+HTTP_POOL_SIZE = int(os.getenv('WATCHDOG_HTTP_POOL', '32'))
+# In-SDK retries (jittered exponential backoff on 429/5xx) before our own fallbacks run
+API_MAX_RETRIES = int(os.getenv('WATCHDOG_API_MAX_RETRIES', '2'))
+
+# Token and cost fields of a cost_info for analyses that made no API call
+_ZERO_COST: Mapping[str, Any] = MappingProxyType({
+    'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0
+})
+
+# Same prices per single token as (input, output); unknown models use gpt-4o-mini's
+_PRICE_PER_TOKEN = {
+    model: (prices['input'] / 1000, prices['output'] / 1000)
+    for model, prices in OPENAI_PRICING.items()
+}
+
+def _dumps_line(obj) -> bytes:
+    """obj as one newline-terminated JSONL line"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj) + '\n').encode()
+
+def _loads(text):
+    """Decode JSON text or bytes, with orjson when it is installed"""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+def _loads_object(text):
+    """Decode a JSON object reply, tolerating prose or code fences around it"""
+    try:
+        return _loads(text)
+    except ValueError:
+        # Local models may ignore response_format; take the outermost {...} span
+        start, end = text.find('{'), text.rfind('}')
+        if not 0 <= start < end:
+            raise
+        return _loads(text[start:end + 1])
+
+def _make_http_client():
+    """Shared keep-alive HTTP client for the OpenAI SDK (None to use the SDK default)"""
+    if httpx is None:
+        return None
+    transport = httpx.AsyncHTTPTransport(
+        http2=h2 is not None,
+        retries=2,
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=min(16, HTTP_POOL_SIZE))
+    )
+    # Same request timeouts as the SDK's own client; local models can be slow
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(600.0, connect=5.0), follow_redirects=True)
+
+# Scope-specific instructions appended to the analysis prompt
+_ANALYSIS_TEMPLATES: Mapping[str, str] = MappingProxyType({
+    'climate': """
+For climate monitoring, focus on:
+- Temperature fluctuations outside normal ranges
+- HVAC efficiency patterns  
+- Unusual heating/cooling cycles
+- Energy optimization opportunities
+""",
+    'security': """
+For security monitoring, focus on:
+- Unusual access patterns (doors, locks)
+- Motion detection anomalies
+- Security system state changes
+- Potential security threats or concerns
+""",
+    'energy': """
+For energy monitoring, focus on:
+- Power consumption spikes or anomalies
+- Device efficiency patterns
+- Opportunities for energy savings
+- Unusual usage patterns
+""",
+    'automation_performance': """
+For automation performance, focus on:
+- Failed automation executions
+- Slow response times
+- Automation conflicts or loops
+- Optimization opportunities
+""",
+    'device_health': """
+For device health monitoring, focus on:
+- Device connectivity issues
+- Battery level warnings
+- Sensor accuracy problems
+- Device failure predictions
+""",
+    'patterns': """
+For pattern analysis, focus on:
+- Recurring behavioral patterns
+- Seasonal adjustments needed
+- Usage optimization opportunities
+- Predictive maintenance indicators
+"""
+})
+
+# System message sent with every analysis request
+_SYSTEM_PROMPT = "You are an intelligent Home Assistant monitoring system. Analyze state changes and provide structured insights in JSON format."
+
+# Numeric changes smaller than max(abs, rel * |reference|) are dropped before analysis
+PREFILTER_DELTA_ABS = float(os.getenv('WATCHDOG_PREFILTER_DELTA_ABS', '0.5'))
+PREFILTER_DELTA_REL = float(os.getenv('WATCHDOG_PREFILTER_DELTA_REL', '0.02'))
+# Two-valued states whose repeated flips on one entity are reported as a single event
+_TOGGLE_STATES = frozenset({'on', 'off', 'open', 'closed', 'locked', 'unlocked', 'home', 'not_home'})
+
+# Prompt block for one StateChange
+_CHANGE_TEMPLATE = "\nEntity: {0.entity_id}\nDomain: {0.domain}\nChange: {0.old_state} → {0.new_state}\nTime: {0.last_changed}\n"
+
+def _scope_key(scope) -> frozenset:
+    """Cache key for a scope list: its scopes that have templates, ignoring order"""
+    return frozenset(_ANALYSIS_TEMPLATES.keys() & set(scope))
+
+@lru_cache(maxsize=32)
+def _scope_templates(scope_key: frozenset) -> str:
+    """Concatenated instructions for the scopes in scope_key, in template order"""
+    return ''.join(f"\n{template}" for s, template in _ANALYSIS_TEMPLATES.items() if s in scope_key)
+
+# One entry of "insights"; JSON mode guarantees valid syntax, so the prompt only names the fields
+_INSIGHT_SCHEMA = '{"type": "security|energy|climate|automation|device_health|pattern", "message": string, "confidence": 0.0-1.0, "entities": [entity_id], "recommended_action": string}'
+
+@lru_cache(maxsize=32)
+def _analysis_prefix(scope_key: frozenset, insight_threshold: float) -> str:
+    """Unchanging head of an analysis prompt"""
+    return f"""You are OpenAI Watchdog, an intelligent Home Assistant monitoring system. 
+Analyze the state changes listed at the end and provide insights.
+
+Respond with a JSON object shaped like:
+{{"requires_attention": boolean, "confidence": 0.0-1.0, "insights": [{_INSIGHT_SCHEMA}]}}
+
+Focus on:
+- Unusual patterns or anomalies
+- Energy optimization opportunities  
+- Security concerns
+- Device health issues
+- Performance problems
+
+Only set requires_attention to true if confidence > {insight_threshold} and there are genuine concerns.
+Be concise but thorough in your analysis.
+{_scope_templates(scope_key)}
+"""
 
 class OpenAIAnalyzer:
     """OpenAI-powered analysis engine for Home Assistant monitoring"""
     
+    __slots__ = (
+        'model', '_price_in', '_price_out', 'insight_threshold', 'client', 'api_key',
+        '_client_cache', '_http', 'data_dir', 'api_log_path', 'log_api_stdout',
+        'backoff_until', 'backoff_seconds', 'backoff_max_seconds', '_api_sem',
+        'batch_state_path', '_pending_batches', '_rate_limiter', '_log_queue', '_log_task', 'analysis_templates'
+    )
+    
     def __init__(self, model: str = "gpt-4o-mini", insight_threshold: float = 0.8):
         self.model = model
+        self._price_in, self._price_out = _PRICE_PER_TOKEN.get(model, _PRICE_PER_TOKEN['gpt-4o-mini'])
         self.insight_threshold = insight_threshold
         self.client = None
         self.api_key: Optional[str] = None
         self._client_cache: Dict[str, Any] = {}
+        self._http = None
         # API audit log path
         self.data_dir = os.getenv('OPENAI_WATCHDOG_DATA', '/config/openai-watchdog')
         self.api_log_path = os.path.join(self.data_dir, 'logs', 'openai_api.log')
         self.log_api_stdout = (os.getenv('WATCHDOG_LOG_API_STDOUT', 'false').lower() == 'true')
+        # Log lines are handed to a writer task, started on first use
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._log_task: Optional[asyncio.Task] = None
         # Backoff state for rate limits/errors
-        self.backoff_until: Optional[datetime] = None
+        # Deadline on the time.monotonic() clock, immune to wall-clock jumps
+        self.backoff_until: Optional[float] = None
         self.backoff_seconds: int = int(os.getenv('WATCHDOG_BACKOFF_INITIAL_SECONDS', '60'))
         self.backoff_max_seconds: int = int(os.getenv('WATCHDOG_BACKOFF_MAX_SECONDS', '7200'))
-        try:
-            os.makedirs(os.path.dirname(self.api_log_path), exist_ok=True)
-        except Exception:
-            pass
+        # Cap on in-flight completion requests across concurrent callers
+        self._api_sem = asyncio.Semaphore(int(os.getenv('WATCHDOG_MAX_CONCURRENT_CALLS', '4')))
+        # Paces online calls by the allowance reported in x-ratelimit-* headers
+        self._rate_limiter = RateLimiter()
+        # Batch API jobs awaiting results: batch_id -> {'submitted', 'changes'}
+        self.batch_state_path = os.path.join(self.data_dir, 'batches.json')
+        self._pending_batches: Dict[str, Dict[str, Any]] = self._load_pending_batches()
         self._initialize_client()
         
         
         # Analysis templates for different monitoring types
-        self.analysis_templates = {
-            'climate': self._get_climate_template(),
-            'security': self._get_security_template(),
-            'energy': self._get_energy_template(),
-            'automation_performance': self._get_automation_template(),
-            'device_health': self._get_device_health_template(),
-            'patterns': self._get_pattern_template()
-        }
+        self.analysis_templates = _ANALYSIS_TEMPLATES
     
     def _initialize_client(self):
         """Initialize OpenAI client with API key"""
@@ -75,59 +263,55 @@ class OpenAIAnalyzer:
             return
             
         try:
+            # Connections (and TLS sessions) are reused across analyses
+            self._http = self._http or _make_http_client()
             base_url = os.getenv('OPENAI_BASE_URL')
             if base_url:
-                self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+                self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http, max_retries=API_MAX_RETRIES)
                 logger.info(f"Initialized OpenAI client with model: {self.model} (base_url={base_url})")
             else:
-                self.client = AsyncOpenAI(api_key=api_key)
+                self.client = AsyncOpenAI(api_key=api_key, http_client=self._http, max_retries=API_MAX_RETRIES)
             logger.info(f"Initialized OpenAI client with model: {self.model}")
         except Exception as e:
             logger.error(f"Failed to initialize OpenAI client: {e}")
     
     def _get_api_key(self) -> Optional[str]:
         """Get OpenAI API key from environment variable (set by Home Assistant configuration)"""
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
+        if not API_KEY:
             logger.warning("No OpenAI API key found in configuration")
             logger.warning("Please set 'openai_api_key' in the Home Assistant add-on configuration")
-        return api_key
+        return API_KEY
     
-    async def analyze_changes(self, changes: List[Dict], context: Dict, monitoring_scope: List[str], provider: Optional[str] = None, local_base_url: Optional[str] = None) -> Dict[str, Any]:
-        """Analyze state changes and return insights"""
-        if not changes:
-            return {'requires_attention': False, 'insights': []}
+    async def analyze_changes(self, changes: List[StateChange], context: Dict, monitoring_scope: List[str], provider: Optional[str] = None, local_base_url: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze state changes and return insights.
 
+        A result with 'skipped' set means nothing was worth analyzing and no
+        provider was called, so there is no request to account for.
+        """
+        if not changes:
+            return {'requires_attention': False, 'insights': [], 'skipped': True}
+        
+        # Drop numeric jitter and collapse repeated toggles before any analysis
+        significant = self._prefilter_changes(changes)
+        if not significant:
+            logger.debug(f"All {len(changes)} changes were below the prefilter thresholds")
+            return {'requires_attention': False, 'insights': [], 'skipped': True}
+        result = await self._analyze_significant(significant, context, monitoring_scope, provider, local_base_url)
+        if len(significant) < len(changes) and isinstance(result.get('cost_info'), dict):
+            result['cost_info']['prefilter_drop_pct'] = round(100.0 * (1 - len(significant) / len(changes)), 1)
+        return result
+    
+    async def _analyze_significant(self, changes: List[StateChange], context: Dict, monitoring_scope: List[str], provider: Optional[str], local_base_url: Optional[str]) -> Dict[str, Any]:
+        """analyze_changes for a non-empty, prefiltered list of changes"""
         # Provider override: explicit mock
         if provider == 'mock':
-            if mock_openai_analysis is not None:
-                mock_result = await mock_openai_analysis(self.model, changes)
-            else:
-                mock_result = {'requires_attention': False, 'insights': [], 'confidence': 0.7, 'processed_changes': len(changes), 'cost_info': {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0}}
-            # annotate provider tier
-            try:
-                mock_result['provider'] = 'mock'
-            except Exception:
-                pass
-            self._log_api_call(
-                prompt="[TIER=mock] Using mock analysis",
-                response_text=json.dumps(mock_result) if isinstance(mock_result, dict) else str(mock_result),
-                usage=None,
-                cost_info={'model': self.model, 'estimated_cost': 0.0, 'note': 'tier-mock', 'provider': 'mock', 'success': True}
-            )
-            try:
-                mock_result['cost_info'] = {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0, 'note': 'tier-mock', 'provider': 'mock', 'success': True}
-            except Exception:
-                pass
-            return mock_result
+            mock_result = await self._mock_openai_analysis(changes)
+            return self._finish_mock(mock_result, "[TIER=mock] Using mock analysis", 'tier-mock')
         
         # If we're in a backoff window, skip real API calls and use mock
         if provider != 'local' and self._is_in_backoff():
-            remaining = int((self.backoff_until - datetime.utcnow()).total_seconds()) if self.backoff_until else 0
-            if mock_openai_analysis is not None:
-                mock_result = await mock_openai_analysis(self.model, changes)
-            else:
-                mock_result = {'requires_attention': False, 'insights': [], 'confidence': 0.7, 'processed_changes': len(changes), 'cost_info': {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0}}
+            remaining = max(0, int(self.backoff_until - time.monotonic())) if self.backoff_until else 0
+            mock_result = await self._mock_openai_analysis(changes)
             # Insert a rate limit/backoff informational insight
             try:
                 mock_result.setdefault('insights', []).insert(0, {
@@ -138,40 +322,20 @@ class OpenAIAnalyzer:
             except Exception:
                 pass
             mock_result['requires_attention'] = mock_result.get('requires_attention', False)
-            self._log_api_call(
-                prompt="[BACKOFF] Skipping OpenAI call; using mock analysis",
-                response_text=json.dumps(mock_result) if isinstance(mock_result, dict) else str(mock_result),
-                usage=None,
-                cost_info={'model': self.model, 'estimated_cost': 0.0, 'note': 'backoff-mock', 'provider': 'mock', 'success': True}
-            )
-            try:
-                mock_result['cost_info'] = {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0, 'note': 'backoff-mock', 'provider': 'mock', 'success': True}
-            except Exception:
-                pass
-            return mock_result
+            return self._finish_mock(mock_result, "[BACKOFF] Skipping OpenAI call; using mock analysis", 'backoff-mock')
 
         if not self.client and provider != 'local':
             logger.warning("OpenAI client not initialized, using mock analysis")
-            if mock_openai_analysis is not None:
-                mock_result = await mock_openai_analysis(self.model, changes)
-            else:
-                mock_result = {'requires_attention': False, 'insights': [], 'confidence': 0.7, 'processed_changes': len(changes), 'cost_info': {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0}}
+            mock_result = await self._mock_openai_analysis(changes)
             # Log mock call for visibility
-            self._log_api_call(
-                prompt="[MOCK] No API key/client; generated mock analysis based on changes",
-                response_text=json.dumps(mock_result) if isinstance(mock_result, dict) else str(mock_result),
-                usage=None,
-                cost_info={'model': self.model, 'estimated_cost': 0.0, 'note': 'mock', 'provider': 'mock', 'success': True}
-            )
-            try:
-                mock_result['cost_info'] = {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0, 'note': 'mock', 'provider': 'mock', 'success': True}
-            except Exception:
-                pass
-            return mock_result
+            return self._finish_mock(mock_result, "[MOCK] No API key/client; generated mock analysis based on changes", 'mock')
+        
+        # One timestamp for the prompt and the structured result
+        now_iso = datetime.now().isoformat()
         
         try:
             # Build analysis prompt based on scope and changes
-            prompt = self._build_analysis_prompt(changes, context, monitoring_scope)
+            prompt = self._build_analysis_prompt(changes, context, monitoring_scope, now_iso)
             logger.debug("OpenAI prompt (model=%s): %s", self.model, prompt)
             
             # Select client based on provider
@@ -183,61 +347,20 @@ class OpenAIAnalyzer:
                     provider_used = 'local'
                 else:
                     logger.warning("Provider 'local' selected but no local_base_url provided; falling back to mock")
-                    if mock_openai_analysis is not None:
-                        mock_result = await mock_openai_analysis(self.model, changes)
-                    else:
-                        mock_result = {'requires_attention': False, 'insights': [], 'confidence': 0.7, 'processed_changes': len(changes), 'cost_info': {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0}}
-                    try:
-                        mock_result['provider'] = 'mock'
-                    except Exception:
-                        pass
-                    self._log_api_call(
-                        prompt="[TIER=local] Missing local_base_url; using mock",
-                        response_text=json.dumps(mock_result) if isinstance(mock_result, dict) else str(mock_result),
-                        usage=None,
-                        cost_info={'model': self.model, 'estimated_cost': 0.0, 'note': 'tier-local-missing-url', 'provider': 'mock', 'success': True}
-                    )
-                    try:
-                        mock_result['cost_info'] = {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0, 'note': 'tier-local-missing-url', 'provider': 'mock', 'success': True}
-                    except Exception:
-                        pass
-                    return mock_result
+                    mock_result = await self._mock_openai_analysis(changes)
+                    return self._finish_mock(mock_result, "[TIER=local] Missing local_base_url; using mock", 'tier-local-missing-url')
 
             # Make OpenAI API call
-            response = await client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an intelligent Home Assistant monitoring system. Analyze state changes and provide structured insights in JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.3
-            )
+            response = await self._create_completion(client, prompt, 1000, provider_used == 'online')
             
             # Extract response and usage info
             analysis_text = response.choices[0].message.content
             usage = getattr(response, 'usage', None)
             # Calculate cost
-            if usage is not None and hasattr(usage, 'prompt_tokens'):
-                cost_info = self._calculate_cost(usage)
-                cost_info['success'] = True
-            else:
-                note = 'tier-local' if provider == 'local' else 'tier-online'
-                cost_info = {
-                    'model': self.model,
-                    'estimated_tokens': 0,
-                    'estimated_cost': 0.0,
-                    'input_tokens': 0,
-                    'output_tokens': 0,
-                    'input_cost': 0.0,
-                    'output_cost': 0.0,
-                    'note': note,
-                    'provider': provider_used,
-                    'success': True
-                }
+            cost_info = self._response_cost_info(usage, provider, provider_used)
             
             # Process and structure the response
-            structured_result = self._structure_analysis(analysis_text, changes)
+            structured_result = self._structure_analysis(analysis_text, changes, now_iso)
             try:
                 structured_result['provider'] = provider_used
             except Exception:
@@ -249,7 +372,7 @@ class OpenAIAnalyzer:
                 prompt=prompt,
                 response_text=analysis_text,
                 usage=usage,
-                cost_info={**cost_info, 'provider': provider_used}
+                cost_info=cost_info
             )
             
             return structured_result
@@ -257,14 +380,7 @@ class OpenAIAnalyzer:
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
             # Fallback to mock analysis
-            if mock_openai_analysis is not None:
-                mock_result = await mock_openai_analysis(self.model, changes)
-            else:
-                mock_result = {'requires_attention': False, 'insights': [], 'confidence': 0.7, 'processed_changes': len(changes), 'cost_info': {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0}}
-            try:
-                mock_result['provider'] = 'mock'
-            except Exception:
-                pass
+            mock_result = await self._mock_openai_analysis(changes)
             # If unauthorized, attach a clear insight message
             try:
                 msg = str(e)
@@ -279,7 +395,7 @@ class OpenAIAnalyzer:
                 if provider != 'local' and ('429' in msg or 'rate_limit_exceeded' in msg or 'Rate limit' in msg):
                     wait_s = self._parse_wait_seconds(msg) or self.backoff_seconds
                     self._apply_backoff(wait_s)
-                    resume_in = int((self.backoff_until - datetime.utcnow()).total_seconds()) if self.backoff_until else wait_s
+                    resume_in = max(0, int(self.backoff_until - time.monotonic())) if self.backoff_until else wait_s
                     mock_result.setdefault('insights', []).insert(0, {
                         'type': 'rate_limit',
                         'message': f'OpenAI rate limit reached. Pausing real analysis for ~{resume_in}s.',
@@ -287,17 +403,158 @@ class OpenAIAnalyzer:
                     })
             except Exception:
                 pass
-            self._log_api_call(
-                prompt="[MOCK-FALLBACK] OpenAI API error; generated mock analysis",
-                response_text=json.dumps(mock_result) if isinstance(mock_result, dict) else str(mock_result),
-                usage=None,
-                cost_info={'model': self.model, 'estimated_cost': 0.0, 'note': 'mock-fallback', 'provider': 'mock', 'success': False}
+            return self._finish_mock(mock_result, "[MOCK-FALLBACK] OpenAI API error; generated mock analysis", 'mock-fallback', success=False)
+
+    async def analyze_changes_batch(self, changes: List[StateChange], context: Dict, monitoring_scope: List[str]) -> Optional[str]:
+        """Queue an analysis on the Batch API and return its batch id; results arrive via poll_batches
+
+        Returns None without submitting anything when no change survives the prefilter.
+        """
+        if not self.client:
+            raise RuntimeError("OpenAI client not initialized")
+        changes = self._prefilter_changes(changes)
+        if not changes:
+            logger.debug("No significant changes after prefiltering; no batch submitted")
+            return None
+        now_iso = datetime.now().isoformat()
+        prompt = self._build_analysis_prompt(changes, context, monitoring_scope, now_iso)
+        return await self._submit_batch([prompt], len(changes))
+    
+    async def _submit_batch(self, prompts: List[str], change_count: int) -> str:
+        """Upload one chat completion request per prompt as a batch job"""
+        lines = [
+            _dumps_line({
+                'custom_id': f'analysis-{i}',
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': self.model,
+                    'messages': [
+                        {'role': 'system', 'content': _SYSTEM_PROMPT},
+                        {'role': 'user', 'content': prompt}
+                    ],
+                    'max_tokens': 1000,
+                    'temperature': 0.3,
+                    'seed': 0,
+                    'response_format': {'type': 'json_object'}
+                }
+            })
+            for i, prompt in enumerate(prompts)
+        ]
+        async with self._api_sem:
+            input_file = await self.client.files.create(
+                file=('watchdog-batch.jsonl', b''.join(lines)),
+                purpose='batch'
             )
+            batch = await self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint='/v1/chat/completions',
+                completion_window='24h'
+            )
+        self._pending_batches[batch.id] = {'submitted': datetime.now().isoformat(), 'changes': change_count}
+        self._save_pending_batches()
+        logger.info(f"Submitted batch {batch.id} with {len(prompts)} request(s)")
+        return batch.id
+    
+    def has_pending_batches(self) -> bool:
+        """True while any submitted batch hasn't been collected"""
+        return bool(self._pending_batches)
+    
+    async def poll_batches(self) -> List[Dict[str, Any]]:
+        """Collect finished batch jobs as structured analyses (cost at batch pricing)"""
+        if not self.client or not self._pending_batches:
+            return []
+        results = []
+        for batch_id, info in list(self._pending_batches.items()):
             try:
-                mock_result['cost_info'] = {'model': self.model, 'estimated_tokens': 0, 'estimated_cost': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'input_cost': 0.0, 'output_cost': 0.0, 'note': 'mock-fallback', 'provider': 'mock', 'success': False}
-            except Exception:
-                pass
-            return mock_result
+                batch = await self.client.batches.retrieve(batch_id)
+            except Exception as e:
+                logger.warning(f"Failed to check batch {batch_id}: {e}")
+                continue
+            if batch.status in ('failed', 'expired', 'cancelled'):
+                logger.warning(f"Batch {batch_id} ended with status {batch.status}; dropping it")
+                del self._pending_batches[batch_id]
+                continue
+            if batch.status != 'completed':
+                continue
+            try:
+                if batch.output_file_id:
+                    output = await self.client.files.content(batch.output_file_id)
+                    results.extend(self._structure_batch_output(output.text, info))
+            except Exception as e:
+                logger.warning(f"Failed to read results of batch {batch_id}: {e}")
+                continue
+            del self._pending_batches[batch_id]
+        self._save_pending_batches()
+        return results
+    
+    def _structure_batch_output(self, output_text: str, info: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Turn a batch output JSONL file into structured analyses"""
+        results = []
+        now_iso = datetime.now().isoformat()
+        for line in output_text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                body = _loads(line)['response']['body']
+                analysis_text = body['choices'][0]['message']['content']
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                logger.warning(f"Skipping malformed batch result: {e}")
+                continue
+            usage = body.get('usage') or {}
+            input_tokens = usage.get('prompt_tokens', 0)
+            output_tokens = usage.get('completion_tokens', 0)
+            cost_info = self._token_cost(
+                input_tokens, 0, output_tokens, usage.get('total_tokens', input_tokens + output_tokens), BATCH_PRICE_MULTIPLIER
+            )
+            cost_info.update(note='tier-batch', provider='online', success=True)
+            result = self._structure_analysis(analysis_text, (), now_iso)
+            result['changes_analyzed'] = info.get('changes', 0)
+            result['provider'] = 'online'
+            result['cost_info'] = cost_info
+            self._log_api_call(prompt='[BATCH] Collected batch result', response_text=analysis_text, usage=None, cost_info=cost_info)
+            results.append(result)
+        return results
+    
+    def _load_pending_batches(self) -> Dict[str, Dict[str, Any]]:
+        """Read submitted-but-uncollected batch ids from disk"""
+        try:
+            with open(self.batch_state_path, 'r') as f:
+                pending = json.load(f)
+            return pending if isinstance(pending, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Failed to load pending batches: {e}")
+            return {}
+    
+    def _save_pending_batches(self):
+        """Persist pending batch ids so results survive a restart"""
+        try:
+            tmp_path = self.batch_state_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._pending_batches, f)
+            os.replace(tmp_path, self.batch_state_path)
+        except Exception as e:
+            logger.warning(f"Failed to save pending batches: {e}")
+    
+    async def _mock_openai_analysis(self, changes: List[StateChange]) -> Dict[str, Any]:
+        """Heuristic analysis used whenever the real API is skipped or fails"""
+        if mock_openai_analysis is not None:
+            return await mock_openai_analysis(self.model, changes)
+        return {'requires_attention': False, 'insights': [], 'confidence': 0.7, 'processed_changes': len(changes), 'cost_info': self._mock_cost_info()}
+
+    def _mock_cost_info(self, **extra) -> Dict[str, Any]:
+        """Zero-cost cost_info for analyses that didn't call the API"""
+        return {'model': self.model, **_ZERO_COST, **extra}
+    
+    def _finish_mock(self, mock_result: Dict[str, Any], prompt: str, note: str, success: bool = True) -> Dict[str, Any]:
+        """Tag a mock analysis with its provider and cost, and record it in the API log"""
+        cost_info = self._mock_cost_info(note=note, provider='mock', success=success)
+        mock_result['provider'] = 'mock'
+        mock_result['cost_info'] = cost_info
+        self._log_api_call(prompt=prompt, response_text=mock_result, usage=None, cost_info=cost_info)
+        return mock_result
 
     def _get_or_create_client(self, base_url: str):
         if AsyncOpenAI is None:
@@ -306,41 +563,75 @@ class OpenAIAnalyzer:
         if key in self._client_cache:
             return self._client_cache[key]
         # Use configured API key if present; local servers typically ignore it
-        api_key = self.api_key or os.getenv('OPENAI_API_KEY') or 'local'
+        api_key = self.api_key or API_KEY or 'local'
         try:
-            client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+            self._http = self._http or _make_http_client()
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http, max_retries=API_MAX_RETRIES)
             self._client_cache[key] = client
             return client
         except Exception as e:
             logger.error(f"Failed to create local client for {base_url}: {e}")
             return self.client
 
+    async def aclose(self):
+        """Flush the API log and close the shared HTTP client"""
+        if self._log_task is not None:
+            if not self._log_task.done():
+                # None tells the writer to flush what it holds and exit
+                await self._log_queue.put(None)
+                await self._log_task
+            self._log_task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
     def _is_in_backoff(self) -> bool:
-        try:
-            return self.backoff_until is not None and datetime.utcnow() < self.backoff_until
-        except Exception:
-            return False
+        return self.backoff_until is not None and time.monotonic() < self.backoff_until
 
+    async def _create_completion(self, client, prompt: str, max_tokens: int, online: bool):
+        """One JSON-mode chat completion; online calls wait for the rate limiter first"""
+        if online:
+            # ~4 characters per prompt token, plus the most the reply may use
+            await self._rate_limiter.acquire(len(prompt) // 4 + max_tokens)
+        async with self._api_sem:
+            raw = await client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.3,
+                seed=0,
+                response_format={"type": "json_object"}
+            )
+        if online:
+            self._rate_limiter.update(raw.headers)
+        return raw.parse()
+    
     def _apply_backoff(self, seconds: int):
         try:
-            seconds = max(1, int(seconds))
+            # Up to 20% jitter keeps clients from retrying in lockstep (never early)
+            seconds = max(1, int(seconds * random.uniform(1.0, 1.2)))
         except Exception:
             seconds = self.backoff_seconds
-        self.backoff_until = datetime.utcnow() + timedelta(seconds=seconds)
+        self.backoff_until = time.monotonic() + seconds
         # Exponential backoff for next time, up to cap
         self.backoff_seconds = min(self.backoff_seconds * 2, self.backoff_max_seconds)
-        logger.warning(f"Applying backoff for {seconds}s (next backoff step {self.backoff_seconds}s, until {self.backoff_until} UTC)")
+        resume_at = datetime.utcnow() + timedelta(seconds=seconds)
+        logger.warning(f"Applying backoff for {seconds}s (next backoff step {self.backoff_seconds}s, until {resume_at} UTC)")
 
     def _parse_wait_seconds(self, message: str) -> Optional[int]:
         """Parse 'try again in 3h20m0.959s' style hints from error text to seconds."""
         try:
             # Look for patterns like 'in 3h20m0.959s' or 'in 15m30s' or 'in 45s'
-            m = re.search(r"in\s+((?:(\d+)h)?(?:(\d+)m)?(?:(\d+(?:\.\d+)?)s)?)", message, re.IGNORECASE)
+            m = _WAIT_RE.search(message)
             if not m:
                 return None
-            hours = int(m.group(2)) if m.group(2) else 0
-            minutes = int(m.group(3)) if m.group(3) else 0
-            seconds = float(m.group(4)) if m.group(4) else 0.0
+            hours, minutes, seconds, unit = m.groups()
+            hours = int(hours) if hours else 0
+            minutes = int(minutes) if minutes else 0
+            seconds = float(seconds) / (1000 if unit.lower() == 'ms' else 1) if seconds else 0.0
             total = int(hours * 3600 + minutes * 60 + seconds)
             return max(total, 1)
         except Exception:
@@ -348,19 +639,16 @@ class OpenAIAnalyzer:
     
     def _calculate_cost(self, usage) -> Dict[str, Any]:
         """Calculate API cost based on token usage"""
-        if self.model not in OPENAI_PRICING:
-            # Use gpt-4o-mini pricing as fallback
-            pricing = OPENAI_PRICING['gpt-4o-mini']
-        else:
-            pricing = OPENAI_PRICING[self.model]
-        
         input_tokens = usage.prompt_tokens
-        output_tokens = usage.completion_tokens
-        total_tokens = usage.total_tokens
-        
-        # Calculate cost (pricing is per 1k tokens)
-        input_cost = (input_tokens / 1000) * pricing['input']
-        output_cost = (output_tokens / 1000) * pricing['output']
+        # Prompt prefixes served from OpenAI's cache are billed at a discount
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = min(getattr(details, 'cached_tokens', None) or 0, input_tokens)
+        return self._token_cost(input_tokens, cached_tokens, usage.completion_tokens, usage.total_tokens)
+    
+    def _token_cost(self, input_tokens: int, cached_tokens: int, output_tokens: int, total_tokens: int, multiplier: float = 1.0) -> Dict[str, Any]:
+        """cost_info token and price fields; multiplier scales the whole price (e.g. Batch API)"""
+        input_cost = (input_tokens - cached_tokens * (1 - CACHED_INPUT_MULTIPLIER)) * self._price_in * multiplier
+        output_cost = output_tokens * self._price_out * multiplier
         total_cost = input_cost + output_cost
         
         return {
@@ -368,130 +656,131 @@ class OpenAIAnalyzer:
             'estimated_tokens': total_tokens,
             'estimated_cost': total_cost,
             'input_tokens': input_tokens,
+            'cached_tokens': cached_tokens,
             'output_tokens': output_tokens,
             'input_cost': input_cost,
             'output_cost': output_cost
         }
     
-    def _build_analysis_prompt(self, changes: List[Dict], context: Dict, scope: List[str]) -> str:
+    def _response_cost_info(self, usage, provider: Optional[str], provider_used: str) -> Dict[str, Any]:
+        """cost_info for a completed request, from token usage when the server reports it"""
+        if usage is not None and hasattr(usage, 'prompt_tokens'):
+            cost_info = self._calculate_cost(usage)
+            cost_info['provider'] = provider_used
+            cost_info['success'] = True
+            return cost_info
+        note = 'tier-local' if provider == 'local' else 'tier-online'
+        return self._mock_cost_info(note=note, provider=provider_used, success=True)
+    
+    def _prefilter_changes(self, changes: List[StateChange]) -> List[StateChange]:
+        """Changes worth analyzing, in their original order
+        
+        Numeric changes count once the value has moved far enough from the last
+        reported one, so slow drift still surfaces. Several on/off style flips
+        of one entity become a single event carrying the flip count.
+        """
+        reference: Dict[str, float] = {}
+        toggles: Dict[str, List[StateChange]] = {}
+        kept: List[Any] = []
+        for change in changes:
+            old, new = change.old_state, change.new_state
+            try:
+                new_value = float(new)
+                ref = reference.get(change.entity_id)
+                if ref is None:
+                    ref = float(old)
+            except (TypeError, ValueError):
+                if str(old).lower() in _TOGGLE_STATES and str(new).lower() in _TOGGLE_STATES:
+                    flips = toggles.get(change.entity_id)
+                    if flips is None:
+                        toggles[change.entity_id] = flips = []
+                        # Slot for the (possibly collapsed) event, filled in below
+                        kept.append(change.entity_id)
+                    flips.append(change)
+                else:
+                    kept.append(change)
+                continue
+            if abs(new_value - ref) >= max(PREFILTER_DELTA_ABS, PREFILTER_DELTA_REL * abs(ref)):
+                kept.append(change)
+                reference[change.entity_id] = new_value
+            else:
+                reference.setdefault(change.entity_id, ref)
+        
+        result = []
+        for item in kept:
+            if not isinstance(item, str):
+                result.append(item)
+                continue
+            flips = toggles[item]
+            first, last = flips[0], flips[-1]
+            if len(flips) == 1:
+                result.append(first)
+            else:
+                result.append(StateChange(
+                    entity_id=first.entity_id,
+                    domain=first.domain,
+                    old_state=first.old_state,
+                    new_state=f"{last.new_state} (toggled {len(flips)} times)",
+                    last_changed=last.last_changed
+                ))
+        return result
+    
+    def _build_analysis_prompt(self, changes: List[StateChange], context: Dict, scope: List[str], now_iso: Optional[str] = None) -> str:
         """Build analysis prompt for OpenAI"""
+        if now_iso is None:
+            now_iso = datetime.now().isoformat()
         
-        # Base prompt
-        prompt = f"""You are OpenAI Watchdog, an intelligent Home Assistant monitoring system. 
-Analyze the following state changes and provide insights.
-
+        # Stable instructions first so the server-side prompt cache can reuse them;
+        # pieces are collected and joined once at the end
+        parts = [_analysis_prefix(_scope_key(scope), self.insight_threshold), f"""
 Current scope: {', '.join(scope)}
-Time: {datetime.now().isoformat()}
+Time: {now_iso}
 Recent changes: {len(changes)}
 Context buffer: {context.get('change_count', 0)} recent changes
 
 State Changes:
-"""
+"""]
         
-        # Add change details
-        for change in changes[-10:]:  # Last 10 changes
-            prompt += f"""
-Entity: {change.get('entity_id')}
-Domain: {change.get('domain')}
-Change: {change.get('old_state')} → {change.get('new_state')}
-Time: {change.get('last_changed')}
-"""
+        # Last 10 changes, without copying them out of the batch
+        parts.extend(map(_CHANGE_TEMPLATE.format, islice(changes, max(0, len(changes) - 10), None)))
         
-        # Add scope-specific analysis instructions
-        for scope_item in scope:
-            if scope_item in self.analysis_templates:
-                prompt += f"\n{self.analysis_templates[scope_item]}"
-        
-        prompt += f"""
-
-Please analyze these changes and respond with a JSON object in this exact format:
-{{
-  "requires_attention": boolean,
-  "confidence": number (0.0-1.0),
-  "overall_assessment": "normal|concerning|urgent",
-  "insights": [
-    {{
-      "type": "security|energy|climate|automation|device_health|pattern",
-      "message": "description of the insight",
-      "confidence": number (0.0-1.0),
-      "entities": ["entity_id1", "entity_id2"],
-      "recommended_action": "suggested action if any"
-    }}
-  ],
-  "summary": "brief overall summary"
-}}
-
-Focus on:
-- Unusual patterns or anomalies
-- Energy optimization opportunities  
-- Security concerns
-- Device health issues
-- Performance problems
-
-Only set requires_attention to true if confidence > {self.insight_threshold} and there are genuine concerns.
-Be concise but thorough in your analysis.
-"""
-        
-        return prompt
+        return ''.join(parts)
     
     
-    def _structure_analysis(self, analysis_result, changes: List[Dict]) -> Dict[str, Any]:
+    def _structure_analysis(self, analysis_result, changes: List[StateChange], now_iso: Optional[str] = None) -> Dict[str, Any]:
         """Structure the analysis result into a standard format"""
+        if now_iso is None:
+            now_iso = datetime.now().isoformat()
         
         # If analysis_result is already a dict (from mock), return it with timestamp
         if isinstance(analysis_result, dict):
-            analysis_result['analysis_timestamp'] = datetime.now().isoformat()
+            analysis_result['analysis_timestamp'] = now_iso
             return analysis_result
         
-        # Handle string response from OpenAI API
-        requires_attention = False
-        confidence = 0.7
-        insights = []
-        
+        # Responses are requested as JSON objects (response_format=json_object)
         try:
-            # Try to parse as JSON first
-            if analysis_result.strip().startswith('{'):
-                parsed = json.loads(analysis_result)
-                return {
-                    'requires_attention': parsed.get('requires_attention', False),
-                    'confidence': parsed.get('confidence', 0.7),
-                    'insights': parsed.get('insights', []),
-                    'analysis_timestamp': datetime.now().isoformat(),
-                    'changes_analyzed': len(changes)
-                }
-        except json.JSONDecodeError:
-            pass
-        
-        # Fallback: Parse as text
-        lines = analysis_result.split('\n')
-        
-        for line in lines:
-            if 'Attention Required: True' in line or 'attention_required": true' in line.lower():
-                requires_attention = True
-            elif 'Confidence:' in line or 'confidence' in line.lower():
-                try:
-                    # Extract number from line
-                    import re
-                    match = re.search(r'(\d+\.?\d*)', line)
-                    if match:
-                        confidence = float(match.group(1))
-                        if confidence > 1:  # If it's a percentage
-                            confidence = confidence / 100
-                except:
-                    confidence = 0.7
-            elif line.strip() and not any(skip in line.lower() for skip in ['analysis status:', 'processed', 'time:']):
-                insights.append(line.strip())
-        
+            parsed = _loads_object(analysis_result)
+            return self._result_from_json(parsed, changes, now_iso)
+        except (ValueError, TypeError, AttributeError):
+            # Not JSON, empty content, or JSON that isn't an object
+            logger.warning("Analysis response was not a JSON object; discarding it")
+            return self._result_from_json({'confidence': 0.0}, changes, now_iso)
+    
+    def _result_from_json(self, parsed: Dict, changes: List[StateChange], now_iso: str) -> Dict[str, Any]:
+        """Standard result dict from a decoded JSON analysis"""
         return {
-            'requires_attention': requires_attention and confidence > self.insight_threshold,
-            'confidence': confidence,
-            'insights': insights,
-            'analysis_timestamp': datetime.now().isoformat(),
+            'requires_attention': parsed.get('requires_attention', False),
+            'confidence': parsed.get('confidence', 0.7),
+            'insights': parsed.get('insights', []),
+            'analysis_timestamp': now_iso,
             'changes_analyzed': len(changes)
         }
 
-    def _log_api_call(self, prompt: str, response_text: str, usage: Optional[Any], cost_info: Dict[str, Any]):
-        """Write a structured log entry for the API call (prompt + response)."""
+    def _log_api_call(self, prompt: str, response_text: Union[str, Dict[str, Any]], usage: Optional[Any], cost_info: Dict[str, Any]):
+        """Write a structured log entry for the API call (prompt + response).
+        
+        A dict response (mock results) is embedded as-is and serialized once with the entry.
+        """
         try:
             # Truncate very large strings to keep logs manageable
             def trunc(s, max_len=12000):
@@ -503,7 +792,7 @@ Be concise but thorough in your analysis.
                 'timestamp': datetime.utcnow().isoformat() + 'Z',
                 'model': self.model,
                 'prompt': trunc(prompt or ''),
-                'response': trunc(response_text or ''),
+                'response': response_text if isinstance(response_text, dict) else trunc(response_text or ''),
                 'usage': None if usage is None else {
                     'prompt_tokens': getattr(usage, 'prompt_tokens', None),
                     'completion_tokens': getattr(usage, 'completion_tokens', None),
@@ -511,11 +800,11 @@ Be concise but thorough in your analysis.
                 },
                 'cost': cost_info,
             }
-            # Write JSONL entry
-            with open(self.api_log_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(entry) + '\n')
+            # Queue the JSONL entry for the writer task
+            self._enqueue_log_line(_dumps_line(entry))
             # Also emit a concise debug log
-            logger.debug("OpenAI response (model=%s, tokens=%s): %s", self.model, entry.get('usage'), trunc(response_text, 2000))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("OpenAI response (model=%s, tokens=%s): %s", self.model, entry.get('usage'), trunc(response_text, 2000))
             # Optionally emit prompt/response to stdout for quick debugging
             if self.log_api_stdout:
                 logger.info("OpenAI prompt: %s", trunc(prompt, 4000))
@@ -523,56 +812,83 @@ Be concise but thorough in your analysis.
         except Exception as e:
             logger.warning(f"Failed to write OpenAI API log: {e}")
     
-    def _get_climate_template(self) -> str:
-        return """
-For climate monitoring, focus on:
-- Temperature fluctuations outside normal ranges
-- HVAC efficiency patterns  
-- Unusual heating/cooling cycles
-- Energy optimization opportunities
-"""
-    
-    def _get_security_template(self) -> str:
-        return """
-For security monitoring, focus on:
-- Unusual access patterns (doors, locks)
-- Motion detection anomalies
-- Security system state changes
-- Potential security threats or concerns
-"""
-    
-    def _get_energy_template(self) -> str:
-        return """
-For energy monitoring, focus on:
-- Power consumption spikes or anomalies
-- Device efficiency patterns
-- Opportunities for energy savings
-- Unusual usage patterns
-"""
+    def _enqueue_log_line(self, line: bytes):
+        """Hand one API log line to the writer task"""
+        if self._log_task is None:
+            try:
+                self._log_task = asyncio.get_running_loop().create_task(self._log_writer_loop())
+            except RuntimeError:
+                # No event loop (e.g. called from a script); write directly
+                fd = self._open_log_fd()
+                try:
+                    self._write_log_lines(fd, [line])
+                finally:
+                    os.close(fd)
+                return
+        try:
+            self._log_queue.put_nowait(line)
+        except asyncio.QueueFull:
+            logger.warning("OpenAI API log queue full; dropping entry")
     
-    def _get_automation_template(self) -> str:
-        return """
-For automation performance, focus on:
-- Failed automation executions
-- Slow response times
-- Automation conflicts or loops
-- Optimization opportunities
-"""
+    async def _log_writer_loop(self):
+        """Append queued API log lines in batches, keeping the file open"""
+        loop = asyncio.get_running_loop()
+        fd = None
+        # While the log can't be opened, batches are discarded until the next retry
+        backoff = LOG_REOPEN_BACKOFF
+        retry_at = 0.0
+        try:
+            while True:
+                line = await self._log_queue.get()
+                if line is None:
+                    return
+                lines = [line]
+                deadline = loop.time() + LOG_FLUSH_INTERVAL
+                stopping = False
+                while len(lines) < LOG_FLUSH_BATCH:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        line = await asyncio.wait_for(self._log_queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if line is None:
+                        stopping = True
+                        break
+                    lines.append(line)
+                if fd is None and loop.time() >= retry_at:
+                    try:
+                        fd = await asyncio.to_thread(self._open_log_fd)
+                        backoff = LOG_REOPEN_BACKOFF
+                    except OSError as e:
+                        if backoff == LOG_REOPEN_BACKOFF:
+                            logger.warning(f"Failed to open OpenAI API log, discarding entries until it opens: {e}")
+                        retry_at = loop.time() + backoff
+                        backoff = min(backoff * 2, LOG_REOPEN_BACKOFF_MAX)
+                if fd is not None:
+                    try:
+                        await asyncio.to_thread(self._write_log_lines, fd, lines)
+                    except OSError as e:
+                        logger.warning(f"Failed to write OpenAI API log: {e}")
+                if stopping:
+                    return
+        finally:
+            if fd is not None:
+                os.close(fd)
     
-    def _get_device_health_template(self) -> str:
-        return """
-For device health monitoring, focus on:
-- Device connectivity issues
-- Battery level warnings
-- Sensor accuracy problems
-- Device failure predictions
-"""
+    def _open_log_fd(self) -> int:
+        """Append-only descriptor for the API log, creating its directory on first use"""
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        try:
+            return os.open(self.api_log_path, flags, 0o644)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.api_log_path), exist_ok=True)
+            return os.open(self.api_log_path, flags, 0o644)
     
-    def _get_pattern_template(self) -> str:
-        return """
-For pattern analysis, focus on:
-- Recurring behavioral patterns
-- Seasonal adjustments needed
-- Usage optimization opportunities
-- Predictive maintenance indicators
-"""
\ No newline at end of file
+    @staticmethod
+    def _write_log_lines(fd: int, lines: List[bytes]):
+        """Append a batch of log lines with unbuffered O_APPEND writes"""
+        data = memoryview(b''.join(lines))
+        while data:
+            data = data[os.write(fd, data):]
@@ -5,12 +5,24 @@ Provider selection policy for three-tier analysis fidelity:
 - online (OpenAI API)
 """
 
+import asyncio
 import os
 import logging
-from typing import Optional, Tuple
+import time
+from typing import Iterable, Optional, Tuple
+from urllib.parse import urlsplit
 
 logger = logging.getLogger(__name__)
 
+# Retrospective scopes that can wait for the Batch API's 24h completion window
+BATCH_SCOPES = frozenset({'patterns', 'device_health'})
+# Seconds a local endpoint reachability probe result is trusted
+LOCAL_HEALTH_TTL = 30.0
+# Seconds allowed for the probe's TCP connect
+LOCAL_PROBE_TIMEOUT = 0.5
+# Seconds between re-reads of WATCHDOG_LOCAL_BASE_URL
+DYNAMIC_REFRESH_INTERVAL = 60.0
+
 
 class ProviderPolicy:
     """Decides which provider to use for a given cycle.
@@ -29,18 +41,40 @@ class ProviderPolicy:
         self.local_enabled = os.getenv('WATCHDOG_LOCAL_ENABLED', 'false').lower() == 'true'
         self.local_base_url = os.getenv('WATCHDOG_LOCAL_BASE_URL', '').strip()
         self.local_max_cpu_load = float(os.getenv('WATCHDOG_LOCAL_MAX_CPU_LOAD', '1.5'))
+        self.batch_enabled = os.getenv('WATCHDOG_ENABLE_BATCH_API', 'false').lower() == 'true'
+        # Last local endpoint probe as (reachable, expires on time.monotonic());
+        # assumed reachable until the first probe says otherwise
+        self._local_health: Tuple[bool, float] = (True, 0.0)
+        self._probe_task: Optional[asyncio.Task] = None
+        self._refreshed_at = time.monotonic()
 
-    def choose_provider(self, analyzer, cost_tracker) -> Tuple[str, Optional[str]]:
-        """Return (provider, base_url) where provider in {'mock','local','online'}.
+    def choose_provider(self, analyzer, cost_tracker, scope: Optional[Iterable[str]] = None) -> Tuple[str, Optional[str], str]:
+        """Return (provider, base_url, tier) where provider in {'mock','local','online'}.
 
-        base_url is only relevant when provider == 'local'.
+        base_url is only relevant when provider == 'local'. tier is 'batch' when an
+        online analysis of scope may go through the Batch API, else 'sync'.
         """
-        mode = self.mode
-        online_allowed = cost_tracker.can_make_request() and not analyzer._is_in_backoff()
-        # Reload dynamic base URL if run.sh started an embedded server
+        provider, base_url = self._choose(analyzer, cost_tracker)
+        tier = 'sync'
+        if provider == 'online' and self.batch_enabled and scope and BATCH_SCOPES.issuperset(scope):
+            tier = 'batch'
+        return provider, base_url, tier
+
+    def refresh_dynamic(self):
+        """Re-read settings that can change at runtime (the embedded server's base URL)"""
+        self._refreshed_at = time.monotonic()
         dyn_base = os.getenv('WATCHDOG_LOCAL_BASE_URL', '').strip()
         if dyn_base and dyn_base != self.local_base_url:
             self.local_base_url = dyn_base
+            # Probe the new endpoint instead of trusting the old one's result
+            self._local_health = (True, 0.0)
+
+    def _choose(self, analyzer, cost_tracker) -> Tuple[str, Optional[str]]:
+        """Pick (provider, base_url) from mode, budget, backoff and local availability"""
+        if time.monotonic() - self._refreshed_at >= DYNAMIC_REFRESH_INTERVAL:
+            self.refresh_dynamic()
+        mode = self.mode
+        online_allowed = cost_tracker.can_make_request() and not analyzer._is_in_backoff()
         local_ok = self._local_available()
 
         # Mode overrides
@@ -74,4 +108,29 @@ class ProviderPolicy:
         except Exception:
             # If load cannot be read, be conservative and allow
             pass
-        return True
+        return self._local_reachable()
+
+    def _local_reachable(self) -> bool:
+        """Cached reachability of the local endpoint, refreshed in the background"""
+        reachable, expires = self._local_health
+        if time.monotonic() >= expires and (self._probe_task is None or self._probe_task.done()):
+            try:
+                # choose_provider is synchronous; use the last result until the probe lands
+                self._probe_task = asyncio.get_running_loop().create_task(self._probe_local())
+            except RuntimeError:
+                pass
+        return reachable
+
+    async def _probe_local(self):
+        """TCP-connect to the local endpoint and cache whether it answered"""
+        url = urlsplit(self.local_base_url)
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(url.hostname, port), LOCAL_PROBE_TIMEOUT)
+            writer.close()
+            reachable = True
+        except (OSError, asyncio.TimeoutError, ValueError):
+            reachable = False
+        if reachable != self._local_health[0]:
+            logger.info(f"Local model endpoint {self.local_base_url} is {'reachable' if reachable else 'unreachable'}")
+        self._local_health = (reachable, time.monotonic() + LOCAL_HEALTH_TTL)
@@ -0,0 +1,101 @@
+"""
+Client-side rate limiting driven by OpenAI's x-ratelimit-* response headers
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Reset durations as sent in x-ratelimit-reset-*, e.g. '6m0s', '1.5s' or '20ms'
+_DURATION_RE = re.compile(r"^(?:(\d+)h)?(?:(\d+)m(?!s))?(?:(\d+(?:\.\d+)?)(ms|s))?$")
+
+
+def _parse_duration(text: Optional[str]) -> Optional[float]:
+    """Seconds in a reset duration header value, or None if it can't be read"""
+    m = _DURATION_RE.match((text or '').strip())
+    if not m or not any(m.groups()):
+        return None
+    hours, minutes, seconds, unit = m.groups()
+    total = int(hours or 0) * 3600 + int(minutes or 0) * 60
+    if seconds:
+        total += float(seconds) / (1000 if unit == 'ms' else 1)
+    return total
+
+
+def _parse_int(text: Optional[str]) -> Optional[int]:
+    """Integer header value, or None if it is missing or malformed"""
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Holds requests back while the server-reported request/token allowance is spent.
+
+    The allowance is learned from the headers of each response and drawn down
+    locally by every request in between, so bursts wait for the window to reset
+    instead of being answered with 429s.
+    """
+
+    def __init__(self):
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        # Deadlines on the time.monotonic() clock
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        # Set (and replaced) by update() so sleeping waiters re-check the new allowance
+        self._updated = asyncio.Event()
+
+    async def acquire(self, est_tokens: int):
+        """Wait until one request of about est_tokens tokens fits the allowance"""
+        while True:
+            # Check and draw-down run without an await in between, so no lock is
+            # needed; waiters sleep independently and re-check on waking
+            now = time.monotonic()
+            # A window that has reset is unknown again until the next response
+            if now >= self.requests_reset_at:
+                self.remaining_requests = None
+            if now >= self.tokens_reset_at:
+                self.remaining_tokens = None
+            wait = self._wait_seconds(est_tokens)
+            if wait <= 0:
+                break
+            logger.info(f"Client-side rate limit reached; waiting {wait:.1f}s")
+            try:
+                # A response's headers may grant allowance before the reset
+                await asyncio.wait_for(self._updated.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= est_tokens
+
+    def _wait_seconds(self, est_tokens: int) -> float:
+        """Time until the allowance admits the request (0 when it already does)"""
+        now = time.monotonic()
+        wait = 0.0
+        if self.remaining_requests is not None and self.remaining_requests < 1:
+            wait = max(wait, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < est_tokens:
+            wait = max(wait, self.tokens_reset_at - now)
+        return wait
+
+    def update(self, headers: Mapping[str, str]):
+        """Adopt the allowance reported by a response's x-ratelimit-* headers"""
+        now = time.monotonic()
+        requests = _parse_int(headers.get('x-ratelimit-remaining-requests'))
+        if requests is not None:
+            self.remaining_requests = requests
+            self.requests_reset_at = now + (_parse_duration(headers.get('x-ratelimit-reset-requests')) or 0.0)
+        tokens = _parse_int(headers.get('x-ratelimit-remaining-tokens'))
+        if tokens is not None:
+            self.remaining_tokens = tokens
+            self.tokens_reset_at = now + (_parse_duration(headers.get('x-ratelimit-reset-tokens')) or 0.0)
+        self._updated.set()
+        self._updated = asyncio.Event()
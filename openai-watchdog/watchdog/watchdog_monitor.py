@@ -5,11 +5,41 @@ Core monitoring loop and state management
 import asyncio
 import os
 import logging
-from datetime import datetime, timedelta, timezone
+import random
+import time
+from array import array
+from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .ha_client import StateChange
 
 logger = logging.getLogger(__name__)
 
+# Recent changes kept for analysis context
+STATE_BUFFER_SIZE = int(os.getenv('WATCHDOG_STATE_BUFFER_SIZE', '1000'))
+# Buffers holding more changes than this build their analysis context off the event loop
+CONTEXT_OFFLOAD_THRESHOLD = int(os.getenv('WATCHDOG_CONTEXT_OFFLOAD_THRESHOLD', '200'))
+# Seconds between checks on submitted Batch API jobs
+BATCH_POLL_INTERVAL = 300
+# Stretch the polling interval by ADAPTIVE_POLL_GROWTH per consecutive cycle without
+# changes, up to MAX_CHECK_INTERVAL seconds; the first change snaps it back
+ADAPTIVE_POLL = os.getenv('WATCHDOG_ADAPTIVE_POLL', 'true').lower() == 'true'
+ADAPTIVE_POLL_GROWTH = 1.5
+MAX_CHECK_INTERVAL = int(os.getenv('WATCHDOG_MAX_CHECK_INTERVAL', '300'))
+# Longest pause, in seconds, after consecutive failed cycles (doubling from check_interval)
+ERROR_BACKOFF_MAX = 300
+# Seconds stop_monitoring waits for in-flight analyses before cancelling them
+INFLIGHT_DRAIN_TIMEOUT = 30
+# Log event-loop stalls (WATCHDOG_DEBUG_LOOP): probe every LOOP_PROBE_INTERVAL seconds
+# and warn when a probe wakes more than LOOP_LAG_WARN seconds late
+DEBUG_LOOP = os.getenv('WATCHDOG_DEBUG_LOOP', 'false').lower() == 'true'
+LOOP_PROBE_INTERVAL = 0.1
+LOOP_LAG_WARN = 0.2
+
 class WatchdogMonitor:
     """Main monitoring service that coordinates all watchdog activities"""
     
@@ -20,10 +50,28 @@ class WatchdogMonitor:
         self.insight_manager = insight_manager
         self.config = config
         self.provider_policy = provider_policy
+        # Options are fixed for the life of the process; bind the ones read every cycle
+        self._scope = config['monitoring_scope']
+        self._interval = config['check_interval']
         
         self.running = False
-        self.state_buffer = StateBuffer(max_size=1000)
+        self.state_buffer = StateBuffer(max_size=STATE_BUFFER_SIZE)
         self.last_check = None
+        self._last_batch_poll = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tick_handle: Optional[asyncio.TimerHandle] = None
+        self._cycle_task: Optional[asyncio.Task] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._lag_task: Optional[asyncio.Task] = None
+        # Loop time the current cycle was due; the next is due check_interval later
+        self._tick_deadline = 0.0
+        self._fail_count = 0
+        # Consecutive cycles that found no state changes
+        self._idle_count = 0
+        # Analyses run as tasks so polling keeps its schedule; the semaphore caps how
+        # many are in flight (a cycle waits for a slot before dispatching another)
+        self._inflight = set()
+        self._inflight_slots = asyncio.Semaphore(self.config.get('max_inflight', 1))
         
     async def start_monitoring(self):
         """Start the main monitoring loop"""
@@ -33,25 +81,88 @@ class WatchdogMonitor:
         # Initialize baseline state
         await self._establish_baseline()
         
-        # Start monitoring loop
-        while self.running:
-            try:
-                await self._monitoring_cycle()
-                await asyncio.sleep(self.config['check_interval'])
-                
-            except Exception as e:
-                logger.error(f"Monitoring cycle error: {e}")
-                await asyncio.sleep(self.config['check_interval'])
+        # Cycles are driven by a timer armed for fixed deadlines check_interval
+        # apart, so slow cycles don't stretch the period; the first runs right away
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if DEBUG_LOOP:
+            self._lag_task = self._loop.create_task(self._loop_watchdog())
+        self._tick_deadline = self._loop.time()
+        self._tick_handle = self._loop.call_soon(self._on_tick)
+        await self._stopped.wait()
     
     async def stop_monitoring(self):
         """Stop the monitoring loop"""
         logger.info("Stopping monitoring loop...")
         self.running = False
+        if self._tick_handle:
+            self._tick_handle.cancel()
+            self._tick_handle = None
+        if self._lag_task:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._cycle_task:
+            # A cycle mid-fetch must not outlive the HA session and cost tracker
+            cycle_task = self._cycle_task
+            cycle_task.cancel()
+            try:
+                await cycle_task
+            except asyncio.CancelledError:
+                pass
+        if self._inflight:
+            # Let running analyses record their cost and insights, within reason
+            _, pending = await asyncio.wait(set(self._inflight), timeout=INFLIGHT_DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+        if self._stopped:
+            self._stopped.set()
+    
+    async def _loop_watchdog(self):
+        """Warn when something blocks the event loop long enough to delay a short sleep"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            t0 = loop.time()
+            await asyncio.sleep(LOOP_PROBE_INTERVAL)
+            lag = loop.time() - t0 - LOOP_PROBE_INTERVAL
+            if lag > LOOP_LAG_WARN:
+                logger.warning(f"Event loop lag {lag:.3f}s")
+    
+    def _on_tick(self):
+        """Timer callback: start one monitoring cycle"""
+        self._tick_handle = None
+        if self.running:
+            self._cycle_task = self._loop.create_task(self._run_cycle())
+    
+    async def _run_cycle(self):
+        """Run a monitoring cycle, then arm the timer for the next deadline"""
+        try:
+            await self._monitoring_cycle()
+            self._fail_count = 0
+        except Exception as e:
+            self._fail_count += 1
+            logger.error(f"Monitoring cycle error: {e}")
+        finally:
+            self._cycle_task = None
+            if self.running:
+                interval = self._poll_interval()
+                now = self._loop.time()
+                self._tick_deadline += interval
+                if self._fail_count:
+                    # Back off exponentially (with jitter) while HA or the API keeps failing
+                    delay = min(interval * 2 ** min(self._fail_count - 1, 16), ERROR_BACKOFF_MAX)
+                    self._tick_deadline = now + delay * random.uniform(0.8, 1.2)
+                elif self._tick_deadline < now - interval:
+                    # More than a whole tick behind: drop the missed ones instead of catching up
+                    self._tick_deadline = now + interval
+                self._tick_handle = self._loop.call_at(self._tick_deadline, self._on_tick)
     
     async def _monitoring_cycle(self):
         """Execute one monitoring cycle"""
         cycle_start = datetime.now(timezone.utc)
         
+        # Finished batch jobs are billed already; collect them even when today's budget is spent
+        await self._collect_batch_results()
+        
         # Check if we're within cost/API limits
         if not self.cost_tracker.can_make_request():
             logger.warning("Daily cost/API limit reached, skipping cycle")
@@ -60,41 +171,88 @@ class WatchdogMonitor:
         # Get recent state changes from Home Assistant
         changes = await self.ha_client.get_recent_changes(
             since=self.last_check,
-            scope=self.config['monitoring_scope']
+            scope=self._scope
         )
         
         if not changes:
             logger.debug("No state changes detected")
+            self._idle_count += 1
             self.last_check = cycle_start
             return
+        self._idle_count = 0
         
         # Add changes to state buffer
         self.state_buffer.add_changes(changes)
         
+        # Context scans every buffered timestamp; build it once per cycle, in a
+        # worker thread when the buffer is large (cycles never overlap)
+        if len(self.state_buffer) > CONTEXT_OFFLOAD_THRESHOLD:
+            context = await asyncio.to_thread(self.state_buffer.get_context)
+        else:
+            context = self.state_buffer.get_context()
+        
         # Choose provider (mock/local/online) per cycle
         provider = None
         local_base_url = None
+        tier = 'sync'
         try:
             if self.provider_policy is not None:
-                provider, local_base_url = self.provider_policy.choose_provider(self.openai_analyzer, self.cost_tracker)
-                logger.info(f"Provider selected (desired): {provider or 'online'}" + (f" (local_base_url={local_base_url})" if provider == 'local' else ""))
+                provider, local_base_url, tier = self.provider_policy.choose_provider(
+                    self.openai_analyzer, self.cost_tracker, scope=self._scope
+                )
+                logger.info(f"Provider selected (desired): {provider or 'online'}" + (f" (local_base_url={local_base_url})" if provider == 'local' else "") + (" via Batch API" if tier == 'batch' else ""))
         except Exception as e:
             logger.warning(f"Provider selection failed: {e}")
-            provider, local_base_url = None, None
+            provider, local_base_url, tier = None, None, 'sync'
+        
+        # Retrospective scopes can wait for the discounted Batch API; results are
+        # recorded and acted on when a later cycle collects them
+        if tier == 'batch':
+            try:
+                await self.openai_analyzer.analyze_changes_batch(changes, context, self._scope)
+                self.last_check = cycle_start
+                return
+            except Exception as e:
+                logger.warning(f"Batch submission failed ({e}); analyzing synchronously")
 
-        # Analyze changes with selected provider, recording attempts/errors and applying fallbacks
-        self.cost_tracker.record_attempt(provider or 'online')
+        # Hand the analysis off so the next poll stays on schedule while it runs
+        await self._inflight_slots.acquire()
+        task = asyncio.create_task(
+            self._analyze_and_process(changes, context, provider, local_base_url, cycle_start)
+        )
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        self.last_check = cycle_start
+    
+    async def _analyze_and_process(self, changes: List[StateChange], context: Dict, provider: Optional[str],
+                                   local_base_url: Optional[str], cycle_start: datetime):
+        """Analyze one cycle's changes and act on the result; holds an in-flight slot"""
+        try:
+            await self._analyze_with_fallback(changes, context, provider, local_base_url)
+            logger.debug(f"Monitoring cycle completed in {datetime.now(timezone.utc) - cycle_start}")
+        except Exception as e:
+            logger.error(f"Analysis error: {e}")
+        finally:
+            self._inflight_slots.release()
+    
+    async def _analyze_with_fallback(self, changes: List[StateChange], context: Dict, provider: Optional[str],
+                                     local_base_url: Optional[str]):
+        """Run the analysis with the chosen provider (falling back local -> mock) and record it"""
+        # Analyze changes with selected provider, recording attempts/errors and applying fallbacks.
+        # The primary attempt is recorded once the analyzer has either called the
+        # provider or failed, so prefilter-only cycles leave the accounting alone.
         analysis = None
         try:
             analysis = await self.openai_analyzer.analyze_changes(
                 changes=changes,
-                context=self.state_buffer.get_context(),
-                monitoring_scope=self.config['monitoring_scope'],
+                context=context,
+                monitoring_scope=self._scope,
                 provider=provider,
                 local_base_url=local_base_url
             )
         except Exception as e:
             # Record error for desired provider
+            self.cost_tracker.record_attempt(provider or 'online')
             self.cost_tracker.record_error(provider or 'online', str(e))
             logger.warning(f"Primary provider failed: {provider or 'online'}; attempting fallback: local -> mock")
             # Attempt local fallback if not already local
@@ -104,8 +262,8 @@ class WatchdogMonitor:
                 try:
                     analysis = await self.openai_analyzer.analyze_changes(
                         changes=changes,
-                        context=self.state_buffer.get_context(),
-                        monitoring_scope=self.config['monitoring_scope'],
+                        context=context,
+                        monitoring_scope=self._scope,
                         provider='local',
                         local_base_url=self.config.get('last_local_base_url') or os.getenv('WATCHDOG_LOCAL_BASE_URL') or ''
                     )
@@ -115,8 +273,8 @@ class WatchdogMonitor:
                     fb_provider = 'mock'
                     analysis = await self.openai_analyzer.analyze_changes(
                         changes=changes,
-                        context=self.state_buffer.get_context(),
-                        monitoring_scope=self.config['monitoring_scope'],
+                        context=context,
+                        monitoring_scope=self._scope,
                         provider='mock'
                     )
             else:
@@ -124,10 +282,15 @@ class WatchdogMonitor:
                 self.cost_tracker.record_attempt('mock')
                 analysis = await self.openai_analyzer.analyze_changes(
                     changes=changes,
-                    context=self.state_buffer.get_context(),
-                    monitoring_scope=self.config['monitoring_scope'],
+                    context=context,
+                    monitoring_scope=self._scope,
                     provider='mock'
                 )
+        else:
+            if analysis.get('skipped'):
+                logger.debug("No significant changes after prefiltering; nothing to analyze")
+                return
+            self.cost_tracker.record_attempt(provider or 'online')
 
         # Reflect the actual provider used (after possible fallback)
         try:
@@ -159,6 +322,21 @@ class WatchdogMonitor:
         self.cost_tracker.record_request(cost_info)
         
         # Process any insights or alerts
+        await self._process_insights(analysis)
+        
+        # Update learning patterns if enabled
+        if self.config['enable_learning']:
+            await self._update_patterns(changes, analysis)
+    
+    def _poll_interval(self) -> float:
+        """Seconds until the next cycle, stretched while the house is quiet"""
+        interval = self._interval
+        if not ADAPTIVE_POLL or not self._idle_count:
+            return interval
+        return max(interval, min(interval * ADAPTIVE_POLL_GROWTH ** min(self._idle_count, 32), MAX_CHECK_INTERVAL))
+    
+    async def _process_insights(self, analysis: Dict):
+        """Hand an analysis to the insight manager when it warrants attention"""
         if analysis.get('requires_attention', False):
             await self.insight_manager.process_insight(analysis)
         elif self.config.get('notify_on_any_insight', False) and analysis.get('insights'):
@@ -166,13 +344,18 @@ class WatchdogMonitor:
             safe_analysis = dict(analysis)
             safe_analysis['requires_attention'] = False
             await self.insight_manager.process_insight(safe_analysis)
-        
-        # Update learning patterns if enabled
-        if self.config['enable_learning']:
-            await self._update_patterns(changes, analysis)
-        
-        self.last_check = cycle_start
-        logger.debug(f"Monitoring cycle completed in {datetime.now(timezone.utc) - cycle_start}")
+    
+    async def _collect_batch_results(self):
+        """Record and act on Batch API analyses that have finished"""
+        if not self.openai_analyzer.has_pending_batches():
+            return
+        now = time.monotonic()
+        if now - self._last_batch_poll < BATCH_POLL_INTERVAL:
+            return
+        self._last_batch_poll = now
+        for analysis in await self.openai_analyzer.poll_batches():
+            self.cost_tracker.record_request(analysis['cost_info'])
+            await self._process_insights(analysis)
     
     async def _establish_baseline(self):
         """Establish baseline state for monitoring"""
@@ -181,7 +364,7 @@ class WatchdogMonitor:
         try:
             # Get current state of all monitored entities
             current_state = await self.ha_client.get_current_state(
-                scope=self.config['monitoring_scope']
+                scope=self._scope
             )
             
             self.state_buffer.set_baseline(current_state)
@@ -193,27 +376,54 @@ class WatchdogMonitor:
             logger.error(f"Failed to establish baseline: {e}")
             raise
     
-    async def _update_patterns(self, changes: List[Dict], analysis: Dict):
+    async def _update_patterns(self, changes: List[StateChange], analysis: Dict):
         """Update learned patterns based on analysis"""
         # TODO: Implement pattern learning
         # This would update stored patterns based on observed behavior
         pass
 
+def _parse_ts(value: Optional[str]) -> float:
+    """Epoch seconds of an HA ISO timestamp ('Z' or offset suffix); NaN if missing or unparseable"""
+    try:
+        # Only a trailing 'Z' needs rewriting; HA normally sends '+00:00' already
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        dt = datetime.fromisoformat(value)
+    except (AttributeError, ValueError):
+        return float('nan')
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
 class StateBuffer:
     """Buffer to store recent state changes for context"""
     
     def __init__(self, max_size: int = 1000):
         self.max_size = max_size
-        self.changes = []
+        # Ring of changes with their epoch timestamps (parsed once on insert, NaN if
+        # unusable) in a parallel float array; _head counts every change ever added.
+        # History arrives grouped by entity, so timestamps aren't sorted.
+        self._slots: List[Optional[StateChange]] = [None] * max_size
+        if np is not None:
+            self._ts = np.full(max_size, np.nan)
+        else:
+            self._ts = array('d', [float('nan')]) * max_size
+        self._head = 0
         self.baseline = {}
     
-    def add_changes(self, changes: List[Dict]):
+    def __len__(self) -> int:
+        return min(self._head, self.max_size)
+    
+    def add_changes(self, changes: List[StateChange]):
         """Add new state changes to buffer"""
-        self.changes.extend(changes)
-        
-        # Trim buffer if it exceeds max size
-        if len(self.changes) > self.max_size:
-            self.changes = self.changes[-self.max_size:]
+        size = self.max_size
+        slots, ts, head = self._slots, self._ts, self._head
+        for change in changes:
+            i = head % size
+            slots[i] = change
+            ts[i] = _parse_ts(change.last_changed)
+            head += 1
+        self._head = head
     
     def set_baseline(self, state: Dict):
         """Set baseline state"""
@@ -221,26 +431,24 @@ class StateBuffer:
     
     def get_context(self, lookback_minutes: int = 60) -> Dict:
         """Get recent context for analysis"""
-        cutoff = datetime.now(timezone.utc) - timedelta(minutes=lookback_minutes)
-        recent_changes = []
-        for change in self.changes:
-            ts = change.get('last_changed', '')
-            if not ts:
-                continue
-            try:
-                # Normalize 'Z' suffix and parse
-                ts_norm = ts.replace('Z', '+00:00')
-                dt = datetime.fromisoformat(ts_norm)
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
-            except Exception:
-                continue
-            if dt > cutoff:
-                recent_changes.append(change)
+        cutoff = time.time() - lookback_minutes * 60
+        size, count = self.max_size, len(self)
+        # Physical index of the oldest change; the ring is only rotated once full
+        start = self._head % size if self._head > size else 0
+        slots = self._slots
+        # NaN (no usable timestamp) never compares greater, so those changes are left out
+        if np is not None:
+            idxs = np.flatnonzero(self._ts[:count] > cutoff)
+            if start:
+                idxs = np.concatenate((idxs[idxs >= start], idxs[idxs < start]))
+            recent_changes = [slots[i] for i in idxs.tolist()]
+        else:
+            ts = self._ts
+            recent_changes = [slots[i % size] for i in range(start, start + count) if ts[i % size] > cutoff]
         
         return {
             'baseline': self.baseline,
             'recent_changes': recent_changes,
             'change_count': len(recent_changes),
-            'buffer_size': len(self.changes)
-        }
\ No newline at end of file
+            'buffer_size': count
+        }
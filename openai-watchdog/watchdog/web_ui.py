@@ -2,22 +2,82 @@
 Lightweight ingress web UI server for OpenAI Watchdog
 """
 
+import asyncio
+import gzip
+import hashlib
 import os
 import logging
-import aiohttp
+import time
 from aiohttp import web
 from .local_server import LocalServerManager
+try:
+  import orjson
+except ImportError:
+  import json
+  orjson = None
+
+# Seconds a built /api/status payload is reused, so auto-refreshing tabs share one build
+STATUS_CACHE_TTL = 1.0
+# Seconds a built /api/insights payload is reused
+INSIGHTS_CACHE_TTL = 5.0
+# Seconds between SSE comment lines that keep idle /api/events streams open through proxies
+SSE_HEARTBEAT = 60.0
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_BYTES = 512
+
+
+def _dumps(data) -> bytes:
+  """Encode a response payload as JSON bytes, using orjson's C encoder when available"""
+  if orjson is not None:
+    return orjson.dumps(data, default=str)
+  return json.dumps(data, default=str).encode()
+
+
+@web.middleware
+async def _compress_middleware(request, handler):
+  """Compress sizeable bodies with whatever coding the client accepts"""
+  resp = await handler(request)
+  if (isinstance(resp, web.Response) and 'Content-Encoding' not in resp.headers
+      and isinstance(resp.body, bytes) and len(resp.body) >= COMPRESS_MIN_BYTES):
+    resp.enable_compression()
+  return resp
+
+
+def _json_response(body: bytes):
+  """JSON response around an already encoded body"""
+  return web.Response(body=body, content_type='application/json')
 
 
 class StatusWebServer:
   """Tiny aiohttp server to expose status and insights via ingress"""
 
-  def __init__(self, config, cost_tracker, insight_manager):
+  def __init__(self, config, cost_tracker, insight_manager, session=None):
     self.config = config
+    # Service-wide aiohttp session handed to the local server probes
+    self.session = session
     self.cost_tracker = cost_tracker
     self.insight_manager = insight_manager
     self.web_app = None
     self.web_runner = None
+    # Reused across status requests so probes share one connection pool
+    self.local_manager = None
+    # Filled in by start(): encoded index page, its ETag, and the status fields that never change
+    self._html_bytes = b''
+    self._html_etag = ''
+    self._html_gz = b''
+    self._status_static = {}
+    # (built_at on the time.monotonic() clock, encoded payload)
+    self._status_cache = (float('-inf'), None)
+    self._insights_cache = (float('-inf'), None)
+    # Handler tasks of open /api/events streams, cancelled on stop()
+    self._event_streams = set()
+
+  async def _get_local_manager(self, base_url):
+    if self.local_manager is None or self.local_manager.base_url != base_url:
+      if self.local_manager is not None:
+        await self.local_manager.close()
+      self.local_manager = LocalServerManager(base_url, session=self.session)
+    return self.local_manager
 
   async def start(self):
     # Create app with a quieter access logger to reduce noise
@@ -26,7 +86,7 @@ class StatusWebServer:
       access_logger.setLevel(logging.WARNING)
     except Exception:
       pass
-    self.web_app = web.Application()
+    self.web_app = web.Application(middlewares=[_compress_middleware])
 
     html_str = """
 <!doctype html>
@@ -190,17 +250,47 @@ class StatusWebServer:
           out.textContent = 'Failed to query local status.';
         }
       });
-      // Auto-refresh periodically to reflect new insights and tier changes
-      setInterval(load, 10000);
+      // New insights are pushed over SSE; usage counters refresh on a slow timer.
+      // Browsers without EventSource fall back to the old 10 s polling.
+      if (window.EventSource) {
+        new EventSource('api/events').onmessage = () => load();
+        setInterval(load, 60000);
+      } else {
+        setInterval(load, 10000);
+      }
       </script>
   </body>
 </html>
     """
+    self._html_bytes = html_str.encode('utf-8')
+    self._html_gz = gzip.compress(self._html_bytes)
+    self._html_etag = '"' + hashlib.md5(self._html_bytes, usedforsecurity=False).hexdigest() + '"'
+
+    # Config and environment are fixed for the life of the process
+    bm_path = os.getenv('WATCHDOG_BUNDLED_MODEL', '').strip()
+    bm_sha = os.getenv('WATCHDOG_BUNDLED_MODEL_SHA256', '').strip()
+    self._status_static = {
+      'model': self.config['model'],
+      'check_interval': self.config['check_interval'],
+      'monitoring_scope': self.config['monitoring_scope'],
+      'notify_on_any_insight': self.config.get('notify_on_any_insight', False),
+      'mode': os.getenv('WATCHDOG_MODE', 'auto'),
+      'local_enabled': os.getenv('WATCHDOG_LOCAL_ENABLED', 'false').lower() == 'true',
+    }
+    bundled_static = {
+      'path': bm_path or None,
+      'checksum_expected': True if bm_sha else False,
+      'checksum': bm_sha or None,
+      'source_url': os.getenv('WATCHDOG_LOCAL_MODEL_URL_USED') or None,
+      'download_error': os.getenv('WATCHDOG_LOCAL_MODEL_DOWNLOAD_ERROR') or None
+    }
 
     async def status_handler(request):
+      now = time.monotonic()
+      built_at, body = self._status_cache
+      if now - built_at < STATUS_CACHE_TTL:
+        return _json_response(body)
       # Bundled model status
-      bm_path = os.getenv('WATCHDOG_BUNDLED_MODEL', '').strip()
-      bm_sha = os.getenv('WATCHDOG_BUNDLED_MODEL_SHA256', '').strip()
       bm_present = False
       bm_size = None
       try:
@@ -209,63 +299,87 @@ class StatusWebServer:
           bm_size = os.path.getsize(bm_path)
       except Exception:
         pass
-      return web.json_response({
-        'model': self.config['model'],
-        'check_interval': self.config['check_interval'],
-        'monitoring_scope': self.config['monitoring_scope'],
-        'notify_on_any_insight': self.config.get('notify_on_any_insight', False),
-        'mode': os.getenv('WATCHDOG_MODE', 'auto'),
-        'local_enabled': os.getenv('WATCHDOG_LOCAL_ENABLED', 'false').lower() == 'true',
+      payload = {
+        **self._status_static,
         'last_provider': self.config.get('last_provider', None),
         'last_local_base_url': self.config.get('last_local_base_url', None),
-        'bundled_model': {
-          'path': bm_path or None,
-          'present': bm_present,
-          'size_bytes': bm_size,
-          'checksum_expected': True if bm_sha else False,
-          'checksum': bm_sha or None,
-          'source_url': os.getenv('WATCHDOG_LOCAL_MODEL_URL_USED') or None,
-          'download_error': os.getenv('WATCHDOG_LOCAL_MODEL_DOWNLOAD_ERROR') or None
-        },
+        'bundled_model': {**bundled_static, 'present': bm_present, 'size_bytes': bm_size},
         'usage': self.cost_tracker.get_usage_summary() if self.cost_tracker else {},
         'recent_insights': self.insight_manager.get_recent_insights(24) if self.insight_manager else []
-      })
+      }
+      body = _dumps(payload)
+      self._status_cache = (now, body)
+      return _json_response(body)
 
     async def local_status_handler(request):
       # Determine base URL: prefer dynamic env (embedded/external), fallback to last seen config
       base_url = os.getenv('WATCHDOG_LOCAL_BASE_URL', '').strip() or (self.config.get('last_local_base_url') or '')
       result = {'base_url': base_url or None, 'healthy': False, 'models': [], 'error': None}
       if not base_url:
-        return web.json_response(result)
+        return _json_response(_dumps(result))
       try:
-        mgr = LocalServerManager(base_url)
+        mgr = await self._get_local_manager(base_url)
         healthy = await mgr.is_healthy()
         result['healthy'] = healthy
         # Try to fetch models list from OpenAI-compatible /v1/models
-        url = base_url.rstrip('/') + '/v1/models'
-        timeout = aiohttp.ClientTimeout(total=2)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-          async with session.get(url) as resp:
-            if resp.status == 200:
-              js = await resp.json()
-              # Normalize
-              if isinstance(js, dict) and 'data' in js and isinstance(js['data'], list):
-                result['models'] = js['data']
-              else:
-                result['models'] = js if isinstance(js, list) else []
-            else:
-              result['error'] = f"HTTP {resp.status}"
+        js = await mgr.get_models()
+        # Normalize
+        if isinstance(js, dict) and 'data' in js and isinstance(js['data'], list):
+          result['models'] = js['data']
+        else:
+          result['models'] = js if isinstance(js, list) else []
       except Exception as e:
         result['error'] = str(e)
-      return web.json_response(result)
+      return _json_response(_dumps(result))
 
     async def insights_handler(request):
-      return web.json_response({
-        'insights': self.insight_manager.get_recent_insights(168) if self.insight_manager else []
+      now = time.monotonic()
+      built_at, body = self._insights_cache
+      if now - built_at >= INSIGHTS_CACHE_TTL:
+        body = _dumps({
+          'insights': self.insight_manager.get_recent_insights(168) if self.insight_manager else []
+        })
+        self._insights_cache = (now, body)
+      return _json_response(body)
+
+    async def events_handler(request):
+      resp = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
       })
+      await resp.prepare(request)
+      if not self.insight_manager:
+        return resp
+      task = asyncio.current_task()
+      self._event_streams.add(task)
+      try:
+        event = self.insight_manager.new_insight
+        while True:
+          try:
+            await asyncio.wait_for(event.wait(), SSE_HEARTBEAT)
+          except asyncio.TimeoutError:
+            await resp.write(b': ping\n\n')
+            continue
+          event = self.insight_manager.new_insight
+          insight = self.insight_manager.latest_insight()
+          if insight:
+            await resp.write(b'data: ' + _dumps(insight) + b'\n\n')
+      except ConnectionResetError:
+        pass
+      finally:
+        self._event_streams.discard(task)
+      return resp
 
     async def index_handler(request):
-      return web.Response(text=html_str, content_type='text/html')
+      headers = {'ETag': self._html_etag, 'Cache-Control': 'public, max-age=300', 'Vary': 'Accept-Encoding'}
+      if request.headers.get('If-None-Match') == self._html_etag:
+        return web.Response(status=304, headers=headers)
+      # The page never changes, so it is gzipped once at start() rather than per request
+      if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        return web.Response(body=self._html_gz, content_type='text/html', charset='utf-8', headers=headers)
+      return web.Response(body=self._html_bytes, content_type='text/html', charset='utf-8', headers=headers)
 
     self.web_app.add_routes([
       web.get('/', index_handler),
@@ -273,6 +387,7 @@ class StatusWebServer:
       web.get('/api/status', status_handler),
       web.get('/api/local/status', local_status_handler),
       web.get('/api/insights', insights_handler),
+      web.get('/api/events', events_handler),
     ])
 
     self.web_runner = web.AppRunner(self.web_app)
@@ -282,5 +397,10 @@ class StatusWebServer:
     await site.start()
 
   async def stop(self):
+    # Open event streams never finish on their own; end them so cleanup doesn't wait
+    for task in list(self._event_streams):
+      task.cancel()
+    if self.local_manager:
+      await self.local_manager.close()
     if self.web_runner:
       await self.web_runner.cleanup()